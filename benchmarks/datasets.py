@@ -0,0 +1,192 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+import random
+from xml.etree import ElementTree
+
+from PIL import Image
+
+labels = ["person", "car", "dog", "cat", "bicycle"]
+"""The labels of the synthetic objects."""
+
+def generate_dataset(path, images, boxes, width, height, seed=0):
+    """Generate synthetic images with random bounding boxes, returning them as (name, width, height, boxes) tuples."""
+    rng = random.Random(seed)
+    items = []
+    images_path = os.path.join(path, "images")
+    os.makedirs(images_path, exist_ok=True)
+    # A single noise image is reused, since encoding is not what is measured
+    noise = Image.effect_noise((width, height), 64).convert("RGB")
+
+    for i in range(images):
+        name = "img{:06d}.jpg".format(i)
+        noise.save(os.path.join(images_path, name), quality=90)
+        items.append((name, width, height, [generate_box(rng, width, height) for _ in range(boxes)]))
+
+    return items
+
+def generate_box(rng, width, height):
+    """Generate a random bounding box inside an image, as a (label, xmin, ymin, xmax, ymax) tuple."""
+    w = rng.randint(max(1, width // 20), max(1, width // 2))
+    h = rng.randint(max(1, height // 20), max(1, height // 2))
+    x = rng.randint(0, width - w)
+    y = rng.randint(0, height - h)
+    return (rng.choice(labels), x, y, x + w, y + h)
+
+def write_pascalvoc(path, items):
+    """Write Pascal VOC annotation files."""
+    for name, width, height, boxes in items:
+        root = ElementTree.Element("annotation")
+        ElementTree.SubElement(root, "filename").text = name
+        size = ElementTree.SubElement(root, "size")
+        ElementTree.SubElement(size, "width").text = str(width)
+        ElementTree.SubElement(size, "height").text = str(height)
+
+        for label, xmin, ymin, xmax, ymax in boxes:
+            obj = ElementTree.SubElement(root, "object")
+            ElementTree.SubElement(obj, "name").text = label
+            bndbox = ElementTree.SubElement(obj, "bndbox")
+
+            for key, value in zip(("xmin", "ymin", "xmax", "ymax"), (xmin, ymin, xmax, ymax)):
+                ElementTree.SubElement(bndbox, key).text = str(value)
+
+        write_xml(os.path.join(path, "Annotations", name.rsplit(".", 1)[0] + ".xml"), root)
+
+def write_coco(path, items):
+    """Write an MS COCO Object Detection annotation file."""
+    data = {"images": [], "annotations": [], "categories": [{"id": i + 1, "name": label} for i, label in enumerate(labels)]}
+
+    for i, (name, width, height, boxes) in enumerate(items):
+        data.get("images").append({"id": i + 1, "file_name": name, "width": width, "height": height})
+
+        for label, xmin, ymin, xmax, ymax in boxes:
+            data.get("annotations").append({"id": len(data.get("annotations")) + 1, "image_id": i + 1, "category_id": labels.index(label) + 1, "segmentation": [], "area": (xmax - xmin) * (ymax - ymin), "bbox": [xmin, ymin, xmax - xmin, ymax - ymin], "iscrowd": 0})
+
+    write_json(os.path.join(path, "annotations", "instances_default.json"), data)
+
+def write_cvatimages(path, items):
+    """Write a CVAT for images annotation file."""
+    root = ElementTree.Element("annotations")
+    ElementTree.SubElement(root, "version").text = "1.1"
+
+    for i, (name, width, height, boxes) in enumerate(items):
+        image = ElementTree.SubElement(root, "image", id=str(i), name=name, width=str(width), height=str(height))
+
+        for label, xmin, ymin, xmax, ymax in boxes:
+            ElementTree.SubElement(image, "box", label=label, occluded="0", xtl=str(xmin), ytl=str(ymin), xbr=str(xmax), ybr=str(ymax))
+
+    write_xml(os.path.join(path, "annotations.xml"), root)
+
+def write_datumaro(path, items):
+    """Write a Datumaro annotation file."""
+    data = {"info": {}, "categories": {"label": {"labels": [{"name": label, "parent": "", "attributes": []} for label in labels], "attributes": []}}, "items": []}
+
+    for name, width, height, boxes in items:
+        annotations = [{"id": i, "type": "bbox", "attributes": {}, "group": 0, "label_id": labels.index(label), "z_order": 0, "bbox": [xmin, ymin, xmax - xmin, ymax - ymin]} for i, (label, xmin, ymin, xmax, ymax) in enumerate(boxes)]
+        data.get("items").append({"id": name.rsplit(".", 1)[0], "annotations": annotations, "attr": {}, "image": {"path": name, "size": [height, width]}})
+
+    write_json(os.path.join(path, "annotations", "default.json"), data)
+
+def write_kitti(path, items):
+    """Write KITTI annotation files."""
+    for name, width, height, boxes in items:
+        lines = ["{} 0.00 0 0.00 {} {} {} {} 0.00 0.00 0.00 0.00 0.00 0.00 0.00\n".format(label, xmin, ymin, xmax, ymax) for label, xmin, ymin, xmax, ymax in boxes]
+        write_text(os.path.join(path, "default", "label_2", name.rsplit(".", 1)[0] + ".txt"), lines)
+
+def write_labelme(path, items):
+    """Write LabelMe annotation files."""
+    for name, width, height, boxes in items:
+        root = ElementTree.Element("annotation")
+        ElementTree.SubElement(root, "filename").text = name
+
+        for i, (label, xmin, ymin, xmax, ymax) in enumerate(boxes):
+            obj = ElementTree.SubElement(root, "object")
+            ElementTree.SubElement(obj, "name").text = label
+            ElementTree.SubElement(obj, "id").text = str(i)
+            ElementTree.SubElement(obj, "type").text = "bounding_box"
+            polygon = ElementTree.SubElement(obj, "polygon")
+
+            for x, y in ((xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)):
+                point = ElementTree.SubElement(polygon, "pt")
+                ElementTree.SubElement(point, "x").text = str(x)
+                ElementTree.SubElement(point, "y").text = str(y)
+
+        write_xml(os.path.join(path, "default", name.rsplit(".", 1)[0] + ".xml"), root)
+
+def write_openimages(path, items):
+    """Write an Open Images annotation file."""
+    lines = ["ImageID,Source,LabelName,Confidence,XMin,XMax,YMin,YMax,IsOccluded,IsTruncated,IsGroupOf,IsDepiction,IsInside\n"]
+
+    for name, width, height, boxes in items:
+        for label, xmin, ymin, xmax, ymax in boxes:
+            lines.append("{},xclick,{},1,{},{},{},{},0,0,0,0,0\n".format(name.rsplit(".", 1)[0], label, xmin / width, xmax / width, ymin / height, ymax / height))
+
+    write_text(os.path.join(path, "annotations", "train-annotations-bbox.csv"), lines)
+
+def write_widerface(path, items):
+    """Write a WIDER Face annotation file."""
+    lines = []
+
+    for name, width, height, boxes in items:
+        lines.append("default/{}\n".format(name))
+        lines.append("{}\n".format(len(boxes)))
+
+        for label, xmin, ymin, xmax, ymax in boxes:
+            lines.append("{} {} {} {} 0 0 0 0 0 0 {}\n".format(xmin, ymin, xmax - xmin, ymax - ymin, label))
+
+    write_text(os.path.join(path, "wider_face_split", "wider_face_train_bbx_gt.txt"), lines)
+
+def write_yolo(path, items):
+    """Write YOLO annotation files."""
+    write_text(os.path.join(path, "obj.names"), [label + "\n" for label in labels])
+
+    for name, width, height, boxes in items:
+        lines = ["{} {} {} {} {}\n".format(labels.index(label), (xmin + xmax) / 2 / width, (ymin + ymax) / 2 / height, (xmax - xmin) / width, (ymax - ymin) / height) for label, xmin, ymin, xmax, ymax in boxes]
+        write_text(os.path.join(path, "obj_train_data", name.rsplit(".", 1)[0] + ".txt"), lines)
+
+writers = {
+    "pascalvoc": write_pascalvoc,
+    "coco": write_coco,
+    "cvatimages": write_cvatimages,
+    "datumaro": write_datumaro,
+    "kitti": write_kitti,
+    "labelme": write_labelme,
+    "openimages": write_openimages,
+    "widerface": write_widerface,
+    "yolo": write_yolo
+}
+"""The annotation writer of each format, by command line option."""
+
+def write_xml(path, root):
+    """Write an XML file, creating its directory."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    ElementTree.ElementTree(root).write(path)
+
+def write_json(path, data):
+    """Write a JSON file, creating its directory."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "w") as fp:
+        json.dump(data, fp)
+
+def write_text(path, lines):
+    """Write a text file, creating its directory."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(path, "w") as fp:
+        fp.writelines(lines)
@@ -0,0 +1,167 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+import argparse
+import contextlib
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+
+# The progress bars of the slicing would be measured too, since they cannot be turned off otherwise
+os.environ.setdefault("TQDM_DISABLE", "1")
+
+import image_object_slicer
+from .datasets import generate_dataset, writers
+
+phases = ["discovery", "parsing", "slicing"]
+"""The phases of a slicing job, timed separately."""
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark image-object-slicer on synthetic datasets of every annotation format")
+    format_choices = list(image_object_slicer.formats.keys())
+    parser.add_argument("-f", "--formats", nargs="+", choices=format_choices, default=format_choices, help="The formats of the annotation files to benchmark (default is all)")
+    parser.add_argument("-n", "--images", type=int, default=200, help="The number of synthetic images (default is 200)")
+    parser.add_argument("-b", "--boxes", type=int, default=10, help="The number of bounding boxes per image (default is 10)")
+    parser.add_argument("-r", "--resolution", default="640x480", metavar="WIDTHxHEIGHT", help="The resolution of the synthetic images (default is 640x480)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="The number of parallel workers to run (default is cpu count)")
+    parser.add_argument("-e", "--executor", choices=["processes", "threads"], default="processes", help="The kind of parallel workers to run (default is processes)")
+    parser.add_argument("--repeat", type=int, default=3, help="The number of times to run each format, keeping the fastest time of each phase (default is 3)")
+    parser.add_argument("-d", "--data", help="A path to the directory to generate the datasets in, reusing them if they have the same scale (default is a temporary directory)")
+    parser.add_argument("-o", "--output", help="A path to the JSON file to write the results to (default is the standard output)")
+    parser.add_argument("-c", "--compare", help="A path to the JSON file of previous results to compare with")
+    parser.add_argument("-t", "--threshold", type=float, default=0.1, help="The fraction of slowdown of any phase over the compared results that is a regression (default is 0.1)")
+    args = parser.parse_args()
+    width, height = (int(value) for value in args.resolution.lower().split("x"))
+    scale = {"images": args.images, "boxes": args.boxes, "width": width, "height": height}
+
+    with contextlib.ExitStack() as stack:
+        data = args.data if args.data is not None else stack.enter_context(tempfile.TemporaryDirectory())
+        generate_datasets(data, args.formats, scale)
+        results = {
+            "version": image_object_slicer.__version__,
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": scale,
+            "workers": args.workers,
+            "executor": args.executor,
+            "formats": {format: run_benchmark(data, format, args.workers, args.executor, args.repeat) for format in args.formats}
+        }
+
+    output = json.dumps(results, indent=4)
+
+    if args.output is not None:
+        with open(args.output, "w") as fp:
+            fp.write(output + "\n")
+    else:
+        print(output)
+
+    if args.compare is not None:
+        with open(args.compare) as fp:
+            regressions = compare_results(json.load(fp), results, args.threshold)
+
+        for regression in regressions:
+            print("Regression: {} {} took {:.3f}s instead of {:.3f}s".format(*regression), file=sys.stderr)
+
+        if len(regressions) > 0:
+            sys.exit(1)
+
+def generate_datasets(path, formats, scale):
+    """Generate the synthetic images and the annotation files of each format, unless they were generated at the same scale."""
+    scale_path = os.path.join(path, "scale.json")
+
+    if os.path.exists(scale_path):
+        with open(scale_path) as fp:
+            if json.load(fp) != scale:
+                raise Exception("Found datasets generated at a different scale: {}".format(path))
+
+    items = None
+
+    for format in formats:
+        annotations_path = os.path.join(path, "annotations", format)
+
+        if not os.path.exists(annotations_path):
+            if items is None:
+                print("Generating images", file=sys.stderr)
+                items = generate_dataset(path, scale.get("images"), scale.get("boxes"), scale.get("width"), scale.get("height"))
+
+            print("Generating annotation files: {}".format(format), file=sys.stderr)
+            writers.get(format)(annotations_path + ".tmp", items)
+            # Interrupted generations are not reused
+            os.replace(annotations_path + ".tmp", annotations_path)
+
+    with open(scale_path, "w") as fp:
+        json.dump(scale, fp)
+
+def run_benchmark(path, format, workers, executor, repeat):
+    """Run the phases of a slicing job on the dataset of a format, returning the fastest time of each."""
+    print("Benchmarking: {}".format(format), file=sys.stderr)
+    annotations_path = os.path.join(path, "annotations", format)
+    images_path = os.path.join(path, "images")
+    parser = image_object_slicer.formats.get(format)
+    options = {"large_image": None, "jpegtran": None, "executor": executor, "shard_size": None, "shard": None}
+    times = {phase: [] for phase in phases}
+    slices = 0
+
+    for _ in range(repeat):
+        save_path = tempfile.mkdtemp(dir=path)
+        # The label directories of the previous runs are gone
+        image_object_slicer.label_dirs.clear()
+
+        try:
+            # The progress output would be measured too, so it is turned off
+            start = time.perf_counter()
+            files = image_object_slicer.find_annotation_files(parser, annotations_path, verbose=False)
+            index = image_object_slicer.index_images(images_path, verbose=False)
+            times.get("discovery").append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            slice_table = image_object_slicer.parse_annotation_files(parser, files, workers, options, verbose=False)
+            slice_table = image_object_slicer.find_images(index, slice_table)
+            times.get("parsing").append(time.perf_counter() - start)
+
+            start = time.perf_counter()
+            image_object_slicer.create_label_dirs(slice_table.labels, save_path)
+            image_object_slicer.slice_images(images_path, slice_table, 0, save_path, workers, index, options)
+            times.get("slicing").append(time.perf_counter() - start)
+
+            slices = len(slice_table.label_ids)
+        finally:
+            shutil.rmtree(save_path)
+
+    return dict({phase: min(times.get(phase)) for phase in phases}, images=len(slice_table), slices=slices)
+
+def compare_results(previous, current, threshold):
+    """Find the phases of each format that are slower than in the previous results by more than a threshold."""
+    regressions = []
+
+    for format, result in current.get("formats").items():
+        previous_result = previous.get("formats", {}).get(format)
+
+        if previous_result is None:
+            continue
+
+        for phase in phases:
+            if result.get(phase) > previous_result.get(phase) * (1 + threshold):
+                regressions.append((format, phase, result.get(phase), previous_result.get(phase)))
+
+    return regressions
+
+if __name__ == "__main__":
+    main()
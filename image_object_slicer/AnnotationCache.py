@@ -0,0 +1,83 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import pickle
+
+class AnnotationCache:
+    """Class that stores parsed annotation files on disk, keyed by their path, size and modification time."""
+
+    def __init__(self, path, key):
+        self.path = path
+        """The path of the cache file."""
+
+        self.key = key
+        """The key of everything else the parses depend on, like the format."""
+
+        self.files = {}
+        """The size, modification time and compact parses of each annotation file, by path."""
+
+        self.stats = {}
+        """The size and modification time of each annotation file not found in the cache."""
+
+        self.changed = False
+
+        try:
+            with open(path, "rb") as fp:
+                data = pickle.load(fp)
+
+            if data.get("key") == key:
+                self.files = data.get("files")
+        except Exception:
+            # A missing or unreadable cache is just empty
+            pass
+
+    def get(self, file):
+        """Get the parses of an annotation file, if it did not change since they were stored."""
+        stat = os.stat(file)
+        stat = (stat.st_size, stat.st_mtime_ns)
+        entry = self.files.get(file)
+
+        if entry is not None and entry[:2] == stat:
+            return [self.expand(parse) for parse in entry[2]]
+
+        self.stats[file] = stat
+        return None
+
+    def put(self, file, parses):
+        """Store the parses of an annotation file not found in the cache."""
+        self.files[file] = self.stats.pop(file) + ([self.compact(parse) for parse in parses],)
+        self.changed = True
+
+    def save(self):
+        """Save the cache file, if anything changed."""
+        if self.changed:
+            with open(self.path + ".tmp", "wb") as fp:
+                pickle.dump({"key": self.key, "files": self.files}, fp, pickle.HIGHEST_PROTOCOL)
+
+            os.replace(self.path + ".tmp", self.path)
+            self.changed = False
+
+    @classmethod
+    def compact(cls, parse):
+        """Convert a parse to a compact tuple form."""
+        return (parse.get("name"), tuple((slice.get("xmin"), slice.get("ymin"), slice.get("xmax"), slice.get("ymax"), slice.get("label")) for slice in parse.get("slices")))
+
+    @classmethod
+    def expand(cls, parse):
+        """Convert a parse from its compact tuple form to a usable dict format."""
+        slices = [{"xmin": xmin, "ymin": ymin, "xmax": xmax, "ymax": ymax, "label": label} for xmin, ymin, xmax, ymax, label in parse[1]]
+        return {"name": parse[0], "slices": slices, "labels": {slice.get("label") for slice in slices}}
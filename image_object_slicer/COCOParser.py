@@ -14,8 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
 
-import json
-
+from .JSONStreamReader import JSONStreamReader
 from .SingleFileAnnotationParser import SingleFileAnnotationParser
 
 class COCOParser(SingleFileAnnotationParser):
@@ -26,14 +25,31 @@ class COCOParser(SingleFileAnnotationParser):
     @classmethod
     def split_file(cls, file, labels):
         """Split an MS COCO Object Detection annotation file into annotation items."""
-        with open(file) as fp:
-            data = json.load(fp)
+        labels = None
+        images = None
+        deferred = False
+
+        # The file is read again only if the annotations come before the categories or the images, like the categories do in the official files
+        for key, items in JSONStreamReader.iter_arrays(file, ("categories", "images", "annotations")):
+            if key == "categories":
+                labels = {label.get("id"): label.get("name") for label in items}
+            elif key == "images":
+                images = {image.get("id"): image.get("file_name").split("/")[-1] for image in items}
+            elif labels is not None and images is not None:
+                yield from cls.group_annotations(items, labels, images)
+            else:
+                deferred = True
 
-        labels = {label.get("id"): label.get("name") for label in data.get("categories")}
-        images = {image.get("id"): image.get("file_name").split("/")[-1] for image in data.get("images")}
+        if deferred:
+            yield from cls.group_annotations(JSONStreamReader.iter_items(file, "annotations"), labels or {}, images or {})
+
+    @classmethod
+    def group_annotations(cls, annotations, labels, images):
+        """Group the consecutive annotations of each image into annotation items."""
+        # Only the annotations of a single item are held in memory at a time
         item = None
 
-        for annotation in data.get("annotations"):
+        for annotation in annotations:
             annotation["category_id"] = labels.get(annotation.get("category_id"))
             annotation["image_id"] = images.get(annotation.get("image_id"))
 
@@ -26,27 +26,43 @@ class CVATImagesParser(SingleFileAnnotationParser):
     @classmethod
     def split_file(cls, file, labels):
         """Split a CVAT for images annotation file into annotation items."""
-        data = ElementTree.parse(file)
+        root = None
+        depth = 0
 
-        for item in data.iterfind("image"):
-            if item.find("box") is not None:
-                yield item
+        for event, element in ElementTree.iterparse(file, ("start", "end")):
+            if event == "start":
+                if depth == 0:
+                    root = element
+
+                depth += 1
+            else:
+                depth -= 1
+
+                if depth == 1 and element.tag == "image":
+                    # Items are compact tuples instead of elements, which are expensive to send to the workers
+                    boxes = tuple((obj.get("label"), obj.get("xtl"), obj.get("ytl"), obj.get("xbr"), obj.get("ybr")) for obj in element.iterfind("box"))
+
+                    if len(boxes) > 0:
+                        yield (element.get("name"), boxes)
+
+                if depth == 1:
+                    # Only a single image element is held in memory at a time
+                    root.clear()
 
     @classmethod
     def parse_item(cls, item):
         """Parse a CVAT for images annotation item to a usable dict format."""
-        name = item.get("name").split("/")[-1]
+        name = item[0].split("/")[-1]
         slices = []
         labels = set()
 
-        for obj in item.iterfind("box"):
-            object_label = obj.get("label")
+        for object_label, xtl, ytl, xbr, ybr in item[1]:
             labels.add(object_label)
             slices.append({
-                "xmin": round(float(obj.get("xtl"))),
-                "ymin": round(float(obj.get("ytl"))),
-                "xmax": round(float(obj.get("xbr"))),
-                "ymax": round(float(obj.get("ybr"))),
+                "xmin": round(float(xtl)),
+                "ymin": round(float(ytl)),
+                "xmax": round(float(xbr)),
+                "ymax": round(float(ybr)),
                 "label": object_label
             })
 
@@ -0,0 +1,95 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+import hashlib
+import json
+import os
+import shutil
+import threading
+
+class CropStore:
+    """Class that stores the encoded image slices by content in the save directory, so duplicates are hardlinked instead of written again."""
+
+    dir_name = ".dedup"
+    """The name of the store directory in the save directory."""
+
+    def __init__(self, save_path):
+        self.path = os.path.join(save_path, self.dir_name)
+        """The path of the store directory."""
+
+    def has(self, key):
+        """Check if the image slice of a key is already stored."""
+        return os.path.exists(self.key_path(key))
+
+    def put(self, key, data, extension):
+        """Store an encoded image slice by its key, returning the number of bytes written, which is zero for duplicate content."""
+        content_path = self.file_path("content", hashlib.sha1(data).hexdigest() + "." + extension)
+        written = 0
+
+        if not os.path.exists(content_path):
+            os.makedirs(os.path.dirname(content_path), exist_ok=True)
+            temp_path = "{}.{}-{}.tmp".format(content_path, os.getpid(), threading.get_native_id())
+
+            with open(temp_path, "wb") as fp:
+                fp.write(data)
+
+            # Other workers may be storing the same content concurrently
+            os.replace(temp_path, content_path)
+            written = len(data)
+
+        key_path = self.key_path(key)
+        os.makedirs(os.path.dirname(key_path), exist_ok=True)
+
+        try:
+            os.link(content_path, key_path)
+        except FileExistsError:
+            pass
+        except OSError:
+            shutil.copyfile(content_path, key_path)
+
+        return written
+
+    def link(self, key, slice_path):
+        """Hardlink the stored image slice of a key to a slice file, or copy it if the file system has no hardlinks."""
+        # Renaming a hardlink over another one of the same file does nothing
+        if os.path.exists(slice_path) and os.path.samefile(self.key_path(key), slice_path):
+            return
+
+        temp_path = "{}.{}-{}.tmp".format(slice_path, os.getpid(), threading.get_native_id())
+
+        try:
+            os.link(self.key_path(key), temp_path)
+        except FileExistsError:
+            os.remove(temp_path)
+            os.link(self.key_path(key), temp_path)
+        except OSError:
+            shutil.copyfile(self.key_path(key), temp_path)
+
+        # Slice files from previous runs are replaced
+        os.replace(temp_path, slice_path)
+
+    def key_path(self, key):
+        """Get the path of the stored image slice of a key."""
+        return self.file_path("keys", key)
+
+    def file_path(self, kind, name):
+        """Get the path of a stored file, in a subdirectory by its first characters so no directory gets too large."""
+        return os.path.join(self.path, kind, name[:2], name)
+
+    @classmethod
+    def key(cls, image_hash, bndbox, extension, lossless, max_side=None):
+        """Compute the key of an image slice from the content hash of its image, its bounding box and how it is encoded."""
+        return hashlib.sha1(json.dumps([image_hash, list(bndbox), extension.lower(), lossless, max_side]).encode()).hexdigest()
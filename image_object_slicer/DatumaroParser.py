@@ -14,8 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
 
-import json
-
+from .JSONStreamReader import JSONStreamReader
 from .SingleFileAnnotationParser import SingleFileAnnotationParser
 
 class DatumaroParser(SingleFileAnnotationParser):
@@ -26,13 +25,11 @@ class DatumaroParser(SingleFileAnnotationParser):
     @classmethod
     def split_file(cls, file, labels):
         """Split a Datumaro annotation file into annotation items."""
-        with open(file) as fp:
-            data = json.load(fp)
-
-        labels = data.get("categories").get("label").get("labels")
+        # Only a single item is held in memory at a time
+        labels = JSONStreamReader.load_value(file, "categories").get("label").get("labels")
         labels = [label.get("name") for label in labels]
 
-        for item in data.get("items"):
+        for item in JSONStreamReader.iter_items(file, "items"):
             if len(item.get("annotations")) > 0:
                 for annotation in item.get("annotations"):
                     annotation["label_id"] = labels[annotation.get("label_id")]
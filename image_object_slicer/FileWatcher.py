@@ -0,0 +1,207 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+import ctypes
+import ctypes.util
+from fnmatch import fnmatchcase
+import os
+import pathlib
+import select
+import struct
+import time
+
+from .GlobWalker import GlobWalker
+
+class FileWatcher:
+    """Class that detects the files matching glob patterns that are created, modified or deleted under a directory, with inotify on Linux or by polling."""
+
+    events = 0x8 | 0x40 | 0x80 | 0x100 | 0x200
+    """The inotify events of the watched directories: IN_CLOSE_WRITE, IN_MOVED_FROM, IN_MOVED_TO, IN_CREATE and IN_DELETE."""
+
+    settle_time = 0.2
+    """The time (in seconds) without events to wait for, so the files written in bursts are reported at once."""
+
+    def __init__(self, path, patterns, interval=1):
+        self.path = str(pathlib.Path(path))
+        """The path of the directory the patterns are relative to."""
+
+        self.patterns = [pattern.split("/") for pattern in patterns]
+        """The parts of each pattern, one per directory level."""
+
+        self.interval = interval
+        """The time (in seconds) between polls, if inotify is not available."""
+
+        self.fd = None
+        """The inotify file descriptor, if inotify is available."""
+
+        self.watches = {}
+        """The path of each watched directory, by inotify watch descriptor."""
+
+        self.files = {}
+        """The modification time and size of each matching file, by path."""
+
+        self.start_inotify()
+        self.files = self.scan_all()
+
+    def wait(self):
+        """Wait for matching files to change, returning the paths of the ones created or modified and of the ones deleted."""
+        while True:
+            if self.fd is None:
+                time.sleep(self.interval)
+                files = self.scan_all()
+            else:
+                files = self.read_events()
+
+            changed = sorted(path for path, stat in files.items() if self.files.get(path) != stat)
+            deleted = sorted(path for path in self.files if path not in files)
+            self.files = files
+
+            if len(changed) > 0 or len(deleted) > 0:
+                return (changed, deleted)
+
+    def matches(self, path, pattern):
+        """Check if a watched file matches a pattern."""
+        return self.match(pattern.split("/"), os.path.relpath(path, self.path).split(os.sep))
+
+    def find(self, pattern):
+        """Find the watched files matching a pattern."""
+        return sorted(path for path in self.files if self.matches(path, pattern))
+
+    def close(self):
+        """Stop watching the directories."""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def start_inotify(self):
+        """Watch all directories with inotify, falling back to polling if it is not available."""
+        try:
+            self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+            fd = self.libc.inotify_init1(os.O_CLOEXEC)
+        except (AttributeError, OSError):
+            # Only available on Linux
+            return
+
+        if fd < 0:
+            return
+
+        self.fd = fd
+
+        if not self.watch_tree(self.path):
+            # There are too many directories for the inotify limits
+            self.close()
+
+    def watch_tree(self, path):
+        """Watch a directory and all its subdirectories, returning whether all of them could be watched."""
+        for directory, _, _ in os.walk(path):
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), self.events)
+
+            if wd < 0:
+                return False
+
+            self.watches[wd] = directory
+
+        return True
+
+    def read_events(self):
+        """Wait for inotify events, returning the matching files with the changed directories scanned again."""
+        directories = set()
+        subtrees = set()
+        overflow = False
+        timeout = None
+
+        # Events are read until none arrives for the settle time
+        while len(select.select([self.fd], [], [], timeout)[0]) > 0:
+            data = os.read(self.fd, 1 << 16)
+            offset = 0
+            timeout = self.settle_time
+
+            while offset < len(data):
+                wd, mask, _, length = struct.unpack_from("iIII", data, offset)
+                name = os.fsdecode(data[offset + 16:offset + 16 + length].rstrip(b"\0"))
+                offset += 16 + length
+
+                # IN_Q_OVERFLOW means events were lost
+                if mask & 0x4000:
+                    overflow = True
+                elif wd in self.watches:
+                    directories.add(self.watches.get(wd))
+
+                    # IN_ISDIR means a subdirectory was created, deleted or moved, with all of its files
+                    if mask & 0x40000000:
+                        subtrees.add(os.path.join(self.watches.get(wd), name))
+
+        for subtree in subtrees:
+            if os.path.isdir(subtree) and not self.watch_tree(subtree):
+                overflow = True
+
+        if overflow:
+            return self.scan_all()
+
+        files = {path: stat for path, stat in self.files.items() if os.path.dirname(path) not in directories and not any(path.startswith(os.path.join(subtree, "")) for subtree in subtrees)}
+
+        for directory in directories:
+            files.update(self.scan_directory(directory, False))
+
+        for subtree in subtrees:
+            files.update(self.scan_directory(subtree, True))
+
+        return files
+
+    def scan_all(self):
+        """Find the modification time and size of all matching files."""
+        files = {}
+
+        for parts in self.patterns:
+            for path in GlobWalker(self.path, "/".join(parts)):
+                self.stat_file(path, files)
+
+        return files
+
+    def scan_directory(self, directory, recursive):
+        """Find the modification time and size of the matching files in a directory, and in its subdirectories if recursive."""
+        files = {}
+
+        for root, _, names in os.walk(directory):
+            for name in names:
+                path = os.path.join(root, name)
+                relative = os.path.relpath(path, self.path).split(os.sep)
+
+                if any(self.match(parts, relative) for parts in self.patterns):
+                    self.stat_file(path, files)
+
+            if not recursive:
+                break
+
+        return files
+
+    def stat_file(self, path, files):
+        """Add the modification time and size of a file, unless it was deleted in the meantime."""
+        try:
+            stat = os.stat(path)
+            files[path] = (stat.st_mtime_ns, stat.st_size)
+        except OSError:
+            pass
+
+    def match(self, parts, names):
+        """Match the directory levels of a relative path against the parts of a pattern."""
+        if len(parts) == 0:
+            return len(names) == 0
+        elif parts[0] == "**":
+            # The recursive part matches any number of directories, but not the file
+            return self.match(parts[1:], names) or (len(names) > 1 and self.match(parts, names[1:]))
+
+        return len(names) > 0 and fnmatchcase(names[0], parts[0]) and self.match(parts[1:], names[1:])
@@ -0,0 +1,152 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+from fnmatch import fnmatchcase
+import os
+import pathlib
+from queue import Queue
+from threading import Lock, Thread
+
+class GlobWalker:
+    """Class that finds the files matching a glob pattern with threads scanning directories in parallel, yielding them as they are found."""
+
+    done = object()
+    """The marker put in a queue after its last item."""
+
+    def __init__(self, path, pattern, workers=1):
+        self.path = str(pathlib.Path(path))
+        """The path of the directory the pattern is relative to."""
+
+        self.parts = pattern.split("/")
+        """The parts of the pattern, one per directory level."""
+
+        self.workers = max(1, workers)
+        """The number of threads scanning directories."""
+
+    def __iter__(self):
+        directories = Queue()
+        files = Queue()
+        errors = []
+        # The number of directories queued or being scanned, so the last thread to finish knows the walk is over
+        pending = [1, Lock()]
+        directories.put((self.path, 0))
+        threads = [Thread(target=self.walk, args=(directories, files, pending, errors), daemon=True) for _ in range(self.workers)]
+        # Patterns with more than one recursive part can reach a file in more than one way
+        seen = set() if self.parts.count("**") > 1 else None
+
+        for thread in threads:
+            thread.start()
+
+        while True:
+            batch = files.get()
+
+            if batch is self.done:
+                break
+
+            for file in batch:
+                if seen is None:
+                    yield file
+                elif file not in seen:
+                    seen.add(file)
+                    yield file
+
+        for thread in threads:
+            thread.join()
+
+        if len(errors) > 0:
+            raise errors[0]
+
+    def walk(self, directories, files, pending, errors):
+        """Scan the queued directories, queueing their subdirectories that match the pattern and sending back their matching files."""
+        while True:
+            item = directories.get()
+
+            if item is self.done:
+                break
+
+            try:
+                if len(errors) == 0:
+                    matches = self.scan(*item)
+
+                    with pending[1]:
+                        pending[0] += len(matches[1])
+
+                    for directory in matches[1]:
+                        directories.put(directory)
+
+                    if len(matches[0]) > 0:
+                        files.put(matches[0])
+            except Exception as e:
+                errors.append(e)
+
+            with pending[1]:
+                pending[0] -= 1
+
+                if pending[0] == 0:
+                    for _ in range(self.workers):
+                        directories.put(self.done)
+
+                    files.put(self.done)
+
+    def scan(self, directory, index):
+        """Match the entries of a directory against a part of the pattern, returning the matching files and the subdirectories to match next."""
+        part = self.parts[index]
+        last = index == len(self.parts) - 1
+
+        if part != "**" and not any(char in part for char in "*?["):
+            # Literal parts are checked directly, without listing the directory
+            path = os.path.join(directory, part)
+
+            if last:
+                return ([path] if os.path.isfile(path) else [], [])
+
+            return ([], [(path, index + 1)] if os.path.isdir(path) else [])
+
+        try:
+            with os.scandir(directory) as iterator:
+                entries = list(iterator)
+        except OSError:
+            # Unreadable directories are skipped, like pathlib does
+            return ([], [])
+
+        matches = ([], [])
+        self.match(entries, index, matches)
+        return matches
+
+    def match(self, entries, index, matches):
+        """Match directory entries against a part of the pattern."""
+        part = self.parts[index]
+
+        if part == "**":
+            for entry in entries:
+                # Symbolic links are not followed, so there are no cycles
+                if entry.is_dir(follow_symlinks=False):
+                    matches[1].append((entry.path, index))
+
+            # The recursive part also matches no directory at all
+            if index + 1 < len(self.parts):
+                self.match(entries, index + 1, matches)
+
+            return
+
+        last = index == len(self.parts) - 1
+
+        for entry in entries:
+            if fnmatchcase(entry.name, part):
+                if last and entry.is_file():
+                    matches[0].append(entry.path)
+                elif not last and entry.is_dir():
+                    matches[1].append((entry.path, index + 1))
@@ -0,0 +1,50 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+class ImageIndex:
+    """Class that indexes the images in a directory by name without extension."""
+
+    def __init__(self, storage):
+        self.path = storage.root
+        """The path or URL of the indexed directory."""
+
+        self.files = {}
+        """The file name of each image by name without extension, or a list of them if ambiguous."""
+
+        # A single scan replaces a glob of the whole directory per image
+        for file in storage.scan():
+            name = file.split(".")
+
+            if len(name) > 1:
+                files = self.files.get(name[0])
+
+                if files is None:
+                    self.files[name[0]] = file
+                elif type(files) is str:
+                    self.files[name[0]] = [files, file]
+                else:
+                    files.append(file)
+
+    def find(self, name):
+        """Find the file name candidates of an image name without extension."""
+        files = self.files.get(name)
+
+        if files is None:
+            return []
+        elif type(files) is str:
+            return [files]
+        else:
+            return files
@@ -0,0 +1,198 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import re
+
+try:
+    # Optional accelerated backend
+    import ijson
+except ImportError:
+    ijson = None
+
+class JSONStreamReader:
+    """Class that abstracts the incremental reading of large JSON files."""
+
+    chunk_size = 1 << 20
+    """The amount of characters read from the file at a time."""
+
+    whitespace = re.compile(r"[ \t\n\r]*")
+    number_tail = re.compile(r"[0-9+\-.eE]*")
+    decoder = json.JSONDecoder()
+
+    @classmethod
+    def iter_items(cls, file, key):
+        """Iterate the items of the array at a specific key of the top-level object of a JSON file."""
+        if ijson is not None:
+            with open(file, "rb") as fp:
+                yield from ijson.items(fp, key + ".item", use_float=True)
+        else:
+            with open(file) as fp:
+                reader = cls(fp)
+
+                if reader.find(key):
+                    yield from reader.iter_array()
+
+    @classmethod
+    def load_value(cls, file, key):
+        """Load the value at a specific key of the top-level object of a JSON file."""
+        if ijson is not None:
+            with open(file, "rb") as fp:
+                for value in ijson.items(fp, key, use_float=True):
+                    return value
+        else:
+            with open(file) as fp:
+                reader = cls(fp)
+
+                if reader.find(key):
+                    return reader.decode()
+
+        return None
+
+    @classmethod
+    def iter_arrays(cls, file, keys):
+        """Iterate the arrays at specific keys of the top-level object of a JSON file as (key, items) pairs, in the order they are found in the file, skipping the arrays whose items are not iterated."""
+        if ijson is not None:
+            # The accelerated backend skips values fast, so each array is found in a pass of its own
+            for key in keys:
+                yield (key, cls.iter_items(file, key))
+        else:
+            with open(file) as fp:
+                reader = cls(fp)
+
+                for key in reader.iter_keys():
+                    if key in keys:
+                        yield (key, reader.iter_array())
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.buffer = ""
+        self.position = 0
+        self.offset = 0
+        self.eof = False
+
+    def find(self, key):
+        """Advance to the value at a specific key of the top-level object, skipping the others."""
+        for name in self.iter_keys():
+            if name == key:
+                return True
+
+        return False
+
+    def iter_keys(self):
+        """Iterate the keys of the object at the current position, stopping at each value, which is skipped unless it is consumed whole."""
+        self.expect("{")
+
+        if self.peek() == "}":
+            self.position += 1
+            return
+
+        while True:
+            name = self.decode()
+            self.expect(":")
+            start = self.offset + self.position
+            yield name
+
+            if self.offset + self.position == start:
+                self.skip()
+
+            if self.expect(",}") == "}":
+                return
+
+    def iter_array(self):
+        """Iterate the items of the array at the current position, decoding one at a time."""
+        self.expect("[")
+
+        if self.peek() == "]":
+            self.position += 1
+            return
+
+        while True:
+            yield self.decode()
+
+            if self.expect(",]") == "]":
+                return
+
+    def decode(self):
+        """Decode the value at the current position."""
+        self.peek()
+
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.position)
+            except json.JSONDecodeError:
+                # The value may continue past the end of the buffer
+                if not self.read():
+                    raise
+
+                continue
+
+            # A number may also continue past the end of the buffer
+            if type(value) in (int, float) and self.number_tail.match(self.buffer, end).end() == len(self.buffer) and self.read():
+                continue
+
+            self.position = end
+            return value
+
+    def skip(self):
+        """Skip the value at the current position, decoding the items of arrays and the members of objects one at a time, so only one is held in memory."""
+        char = self.peek()
+
+        if char == "[":
+            for _ in self.iter_array():
+                pass
+        elif char == "{":
+            for _ in self.iter_keys():
+                pass
+        else:
+            self.decode()
+
+    def peek(self):
+        """Skip whitespace and return the next character, or an empty string at the end of the file."""
+        while True:
+            self.position = self.whitespace.match(self.buffer, self.position).end()
+
+            if self.position < len(self.buffer):
+                return self.buffer[self.position]
+
+            if not self.read():
+                return ""
+
+    def expect(self, chars):
+        """Consume the next character, which must be one of the expected ones."""
+        char = self.peek()
+
+        if char == "" or char not in chars:
+            raise Exception("Expected one of {} in JSON file, got {}".format(list(chars), repr(char)))
+
+        self.position += 1
+        return char
+
+    def read(self):
+        """Read more of the file into the buffer, discarding what was already consumed."""
+        if self.eof:
+            return False
+
+        chunk = self.fp.read(self.chunk_size)
+
+        if chunk == "":
+            self.eof = True
+            return False
+
+        self.offset += self.position
+        self.buffer = self.buffer[self.position:] + chunk
+        self.position = 0
+        return True
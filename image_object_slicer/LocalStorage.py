@@ -0,0 +1,47 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+
+from .Storage import Storage
+
+class LocalStorage(Storage):
+    """Class that reads and writes the files under a directory of the local file system."""
+
+    def scan(self):
+        with os.scandir(self.root) as entries:
+            return [entry.name for entry in entries if entry.is_file()]
+
+    def list(self):
+        for directory, _, files in os.walk(self.root):
+            for file in files:
+                yield os.path.relpath(os.path.join(directory, file), self.root).replace(os.sep, "/")
+
+    def read(self, name):
+        with open(os.path.join(self.root, name), "rb") as fp:
+            return fp.read()
+
+    def read_head(self, name, size):
+        with open(os.path.join(self.root, name), "rb") as fp:
+            return fp.read(size)
+
+    def write(self, name, data):
+        with open(os.path.join(self.root, name), "wb") as fp:
+            fp.write(data)
+
+    def version(self, name):
+        stat = os.stat(os.path.join(self.root, name))
+        return (stat.st_size, stat.st_mtime_ns)
@@ -0,0 +1,136 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+import json
+import os
+
+class Manifest:
+    """Class that records the slices produced from each image, so unchanged images can be skipped between runs."""
+
+    def __init__(self, save_path, file_name=".manifest.jsonl"):
+        self.save_path = save_path
+        """The path of the directory the image slices are saved to."""
+
+        self.file_name = file_name
+        """The name of the manifest file in the save directory."""
+
+        self.entries = None
+        """The fingerprint and the slice files of each image, by name."""
+
+        self.seen = set()
+        """The names of the images found in the current run."""
+
+        path = os.path.join(save_path, file_name)
+        self.entries = self.read_entries(path)
+
+        # Each image is appended as soon as it is sliced, so an interrupted run keeps its progress
+        self.journal = open(path, "a")
+
+    def fingerprints(self):
+        """Get the fingerprint of each image sliced in previous runs, by name."""
+        return {name: entry.get("fingerprint") for name, entry in self.entries.items()}
+
+    def record(self, result):
+        """Record the slice files produced from an image, removing the stale ones."""
+        name = result.get("name")
+        self.seen.add(name)
+
+        # Unchanged images were skipped, so their slice files are still the same
+        if result.get("files") is None:
+            return
+
+        entry = self.entries.get(name)
+
+        if entry is not None:
+            self.remove_files(set(entry.get("files")).difference(result.get("files")))
+
+        entry = {"name": name, "fingerprint": result.get("fingerprint"), "files": result.get("files")}
+        self.entries[name] = entry
+        self.journal.write(json.dumps(entry) + "\n")
+        self.journal.flush()
+
+    def remove(self, name):
+        """Remove the slice files of an image whose annotation is gone, forgetting it."""
+        entry = self.entries.pop(name, None)
+        self.seen.discard(name)
+
+        if entry is not None:
+            self.remove_files(entry.get("files"))
+            # The entry without files replaces the previous one when the manifest is read again
+            self.journal.write(json.dumps({"name": name, "fingerprint": None, "files": []}) + "\n")
+            self.journal.flush()
+
+    def close(self):
+        """Remove the slice files of the images not found in the current run and compact the manifest file."""
+        for name in set(self.entries.keys()).difference(self.seen):
+            self.remove_files(self.entries.pop(name).get("files"))
+
+        self.journal.close()
+        self.write_entries(os.path.join(self.save_path, self.file_name), self.entries)
+
+    def remove_files(self, files):
+        """Remove slice files relative to the save directory."""
+        for file in files:
+            try:
+                os.remove(os.path.join(self.save_path, file))
+            except OSError:
+                # Slice files removed by hand are already gone
+                pass
+
+    @classmethod
+    def shard_file_name(cls, shard):
+        """Get the name of the manifest file of a shard of the job, if any, so the nodes do not share it."""
+        if shard is None:
+            return ".manifest.jsonl"
+
+        return ".manifest-{}-of-{}.jsonl".format(*shard)
+
+    @classmethod
+    def merge(cls, save_path, file_names):
+        """Merge the manifest files of all shards of the job into the one of the whole job."""
+        entries = {}
+
+        for file_name in file_names:
+            entries.update(cls.read_entries(os.path.join(save_path, file_name)))
+
+        cls.write_entries(os.path.join(save_path, cls.shard_file_name(None)), entries)
+
+    @classmethod
+    def read_entries(cls, path):
+        """Read the entries of a manifest file, if it exists."""
+        entries = {}
+
+        if os.path.exists(path):
+            with open(path) as fp:
+                for line in fp:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        # The last line may have been cut short by an interrupted run
+                        continue
+
+                    entries[entry.get("name")] = entry
+
+        return entries
+
+    @classmethod
+    def write_entries(cls, path, entries):
+        """Write the entries of a manifest file atomically."""
+        with open(path + ".tmp", "w") as fp:
+            for entry in entries.values():
+                fp.write(json.dumps(entry) + "\n")
+
+        os.replace(path + ".tmp", path)
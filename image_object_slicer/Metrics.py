@@ -0,0 +1,99 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+from bisect import bisect_left
+from contextlib import contextmanager
+import json
+import sys
+import time
+
+try:
+    import resource
+except ImportError:
+    # Only available on Unix
+    resource = None
+
+class Metrics:
+    """Class that records the time of each phase of a run and of each stage of the workers."""
+
+    bounds = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1, 2, 5, 10)
+    """The upper bounds (in seconds) of the buckets of the histograms, followed by one for the slower times."""
+
+    def __init__(self):
+        self.phases = {}
+        """The wall and CPU times of each phase, by name."""
+
+        self.workers = {}
+        """The histograms of the times of each stage, by worker."""
+
+        self.bytes_read = 0
+        self.bytes_written = 0
+        self.images = 0
+
+    @contextmanager
+    def phase(self, name):
+        """Record the wall and CPU times of a phase, including the ones of the worker processes that exit during it."""
+        wall = time.perf_counter()
+        cpu = time.process_time() + self.children_cpu_time()
+
+        try:
+            yield
+        finally:
+            self.phases[name] = {"wall": time.perf_counter() - wall, "cpu": time.process_time() + self.children_cpu_time() - cpu}
+
+    def record(self, metrics):
+        """Record the stage times and byte counts of slicing an image."""
+        self.bytes_read += metrics.get("bytes_read")
+        self.bytes_written += metrics.get("bytes_written")
+        self.images += 1
+
+        # The stages of an image may run in different workers
+        for stage, worker, seconds in metrics.get("stages"):
+            histogram = self.workers.setdefault(worker, {}).setdefault(stage, {"count": 0, "total": 0, "max": 0, "buckets": [0] * (len(self.bounds) + 1)})
+            histogram["count"] += 1
+            histogram["total"] += seconds
+            histogram["max"] = max(histogram.get("max"), seconds)
+            histogram.get("buckets")[bisect_left(self.bounds, seconds)] += 1
+
+    def save(self, path):
+        """Save the metrics report to a JSON file."""
+        report = {
+            "phases": self.phases,
+            "images": self.images,
+            "bytes_read": self.bytes_read,
+            "bytes_written": self.bytes_written,
+            "peak_rss": {"main": self.peak_rss(resource.RUSAGE_SELF) if resource is not None else None, "workers": self.peak_rss(resource.RUSAGE_CHILDREN) if resource is not None else None},
+            "bounds": self.bounds,
+            "workers": self.workers
+        }
+
+        with open(path, "w") as fp:
+            json.dump(report, fp, indent=4)
+
+    @classmethod
+    def children_cpu_time(cls):
+        """Get the CPU time of the worker processes that already exited."""
+        if resource is None:
+            return 0
+
+        usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+        return usage.ru_utime + usage.ru_stime
+
+    @classmethod
+    def peak_rss(cls, who):
+        """Get the peak resident set size (in bytes) of the current process or of its largest worker process."""
+        # It is in KiB, except on macOS
+        return resource.getrusage(who).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
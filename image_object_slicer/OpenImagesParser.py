@@ -14,7 +14,7 @@
 # You should have received a copy of the GNU General Public License
 # along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
 
-from csv import DictReader
+from csv import DictReader, reader
 
 from .SingleFileAnnotationParser import SingleFileAnnotationParser
 
@@ -22,29 +22,49 @@ class OpenImagesParser(SingleFileAnnotationParser):
     """Class that abstracts the annotation parsing of the Open Images format."""
 
     glob = "annotations/*-annotations-bbox.csv"
+    ranged = True
+    header = True
 
     @classmethod
     def split_file(cls, file, labels):
         """Split an Open Images annotation file into annotation items."""
         with open(file, newline="") as fp:
-            data = DictReader(fp)
-            item = None
+            yield from cls.split_rows(DictReader(fp))
 
-            for annotation in data:
-                annotation["ImageID"] = annotation.get("ImageID").split("/")[-1]
+    @classmethod
+    def is_item_start(cls, header, previous, line):
+        """Check whether a line of an Open Images annotation file starts an annotation item, given the previous line."""
+        column = header.strip().split(b",").index(b"ImageID")
+        return previous.split(b",")[column].split(b"/")[-1] != line.split(b",")[column].split(b"/")[-1]
+
+    @classmethod
+    def split_range(cls, file, labels, start, end):
+        """Split a byte range of an Open Images annotation file into annotation items."""
+        with open(file, newline="") as fp:
+            fieldnames = next(reader(fp))
 
-                if item is not None:
-                    if item.get("image") == annotation.get("ImageID"):
-                        item.get("annotations").append(annotation)
-                    else:
-                        yield item
-                        item = None
+        yield from cls.split_rows(DictReader(cls.read_range(file, start, end), fieldnames))
 
-                if item is None:
-                    item = {"image": annotation.get("ImageID"), "annotations": [annotation]}
+    @classmethod
+    def split_rows(cls, data):
+        """Split the rows of an Open Images annotation file into annotation items."""
+        item = None
+
+        for annotation in data:
+            annotation["ImageID"] = annotation.get("ImageID").split("/")[-1]
 
             if item is not None:
-                yield item
+                if item.get("image") == annotation.get("ImageID"):
+                    item.get("annotations").append(annotation)
+                else:
+                    yield item
+                    item = None
+
+            if item is None:
+                item = {"image": annotation.get("ImageID"), "annotations": [annotation]}
+
+        if item is not None:
+            yield item
 
     @classmethod
     def parse_item(cls, item):
@@ -0,0 +1,100 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+import importlib
+
+class ParserRegistry:
+    """Class that maps the annotation formats to their parser classes, importing each parser only when it is used."""
+
+    group = "image_object_slicer.formats"
+    """The entry point group other packages register their parsers in."""
+
+    def __init__(self, parsers):
+        self.parsers = dict(parsers)
+        """The name of the module and class of each built-in parser, relative to this package, by format."""
+
+        self.loaded = {}
+        """The parser classes already imported, by format."""
+
+        self.entry_points = None
+        """The entry points of the parsers of other packages, by format, once they are found."""
+
+    def __contains__(self, format):
+        return format in self.parsers or format in self.find_entry_points()
+
+    def __iter__(self):
+        # The entry points are only found if the formats after the built-in ones are needed
+        yield from list(self.parsers.keys())
+
+        for format in self.find_entry_points().keys():
+            if format not in self.parsers:
+                yield format
+
+    def __len__(self):
+        # Not len(self.keys()), since building a list asks for the length first
+        return sum(1 for format in self)
+
+    def __getitem__(self, format):
+        parser = self.loaded.get(format)
+
+        if parser is not None:
+            return parser
+
+        if format in self.parsers:
+            parser = getattr(importlib.import_module("." + self.parsers.get(format), __package__), self.parsers.get(format))
+        elif format in self.find_entry_points():
+            parser = self.find_entry_points().get(format).load()
+        else:
+            raise KeyError(format)
+
+        self.loaded[format] = parser
+        return parser
+
+    def keys(self):
+        """Get the formats, the built-in ones first."""
+        return list(self)
+
+    def values(self):
+        """Get the parser classes of all formats, importing them."""
+        return [self[format] for format in self]
+
+    def items(self):
+        """Get the formats with their parser classes, importing them."""
+        return [(format, self[format]) for format in self]
+
+    def get(self, format, default=None):
+        """Get the parser class of a format, importing it the first time."""
+        try:
+            return self[format]
+        except KeyError:
+            return default
+
+    def register(self, format, parser):
+        """Register the parser class of a format from the current process, replacing any other."""
+        # The class is already imported, so there is no module to import it from
+        self.parsers[format] = None
+        self.loaded[format] = parser
+
+    def find_entry_points(self):
+        """Find the entry points of the parsers of other packages, the first time they are needed."""
+        if self.entry_points is None:
+            from importlib.metadata import entry_points
+            found = entry_points()
+            # Older versions of Python return a dict of groups
+            found = found.select(group=self.group) if hasattr(found, "select") else found.get(self.group, [])
+            self.entry_points = {entry_point.name: entry_point for entry_point in found}
+
+        return self.entry_points
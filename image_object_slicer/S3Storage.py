@@ -0,0 +1,136 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import os
+
+from .Storage import Storage
+
+class S3Storage(Storage):
+    """Class that reads and writes the objects under a prefix of a bucket of an S3-compatible object store, using boto3."""
+
+    scheme = "s3://"
+    """The scheme of the URLs of the object store."""
+
+    directories = False
+
+    part_size = 8 << 20
+    """The size (in bytes) of the parts of an object that are read or written concurrently."""
+
+    concurrency = 8
+    """The maximum number of parts of an object read or written at once."""
+
+    connections = 32
+    """The maximum number of connections kept open by each process."""
+
+    def __init__(self, root):
+        super().__init__(root)
+        bucket, _, prefix = root[len(self.scheme):].partition("/")
+
+        self.bucket = bucket
+        """The name of the bucket."""
+
+        self.prefix = prefix.strip("/")
+        """The prefix of the keys of the objects, without the trailing slash."""
+
+        self.client = None
+        self.pid = None
+
+    def __getstate__(self):
+        # The clients cannot be pickled, so each worker process creates its own
+        return dict(self.__dict__, client=None, pid=None)
+
+    def get_client(self):
+        """Get the client of the current process, creating it the first time, since its connections cannot be shared with forked processes."""
+        if self.client is None or self.pid != os.getpid():
+            try:
+                import boto3
+                from botocore.config import Config
+            except ImportError:
+                raise Exception("Could not import boto3, required to access S3-compatible object stores")
+
+            # Object stores other than AWS are found with the AWS_ENDPOINT_URL environment variable
+            self.client = boto3.session.Session().client("s3", config=Config(max_pool_connections=self.connections))
+            self.pid = os.getpid()
+
+        return self.client
+
+    def key(self, name):
+        """Get the key of the object of a file name."""
+        return "{}/{}".format(self.prefix, name) if self.prefix != "" else name
+
+    def scan(self):
+        yield from self.list_keys("/")
+
+    def list(self):
+        yield from self.list_keys(None)
+
+    def list_keys(self, delimiter):
+        """List the names of the objects under the prefix, only the ones directly under it if delimited."""
+        prefix = self.key("")
+        arguments = {"Bucket": self.bucket, "Prefix": prefix}
+
+        if delimiter is not None:
+            arguments["Delimiter"] = delimiter
+
+        for page in self.get_client().get_paginator("list_objects_v2").paginate(**arguments):
+            for item in page.get("Contents", []):
+                yield item.get("Key")[len(prefix):]
+
+    def read(self, name):
+        client = self.get_client()
+        from botocore.exceptions import ClientError
+
+        # The first part also tells the size of the object, so small objects take a single request
+        try:
+            response = client.get_object(Bucket=self.bucket, Key=self.key(name), Range="bytes=0-{}".format(self.part_size - 1))
+        except ClientError as e:
+            # Empty objects have no byte range
+            if e.response.get("Error", {}).get("Code") == "InvalidRange":
+                return b""
+
+            raise e
+
+        data = response.get("Body").read()
+        size = int(response.get("ContentRange").split("/")[-1])
+
+        if len(data) >= size:
+            return data
+
+        from concurrent.futures import ThreadPoolExecutor
+        ranges = [(start, min(start + self.part_size, size) - 1) for start in range(len(data), size, self.part_size)]
+
+        with ThreadPoolExecutor(min(len(ranges), self.concurrency)) as executor:
+            return data + b"".join(executor.map(lambda part: self.read_range(name, *part), ranges))
+
+    def read_range(self, name, start, end):
+        """Read an inclusive byte range of an object."""
+        return self.get_client().get_object(Bucket=self.bucket, Key=self.key(name), Range="bytes={}-{}".format(start, end)).get("Body").read()
+
+    def read_head(self, name, size):
+        return self.read_range(name, 0, size - 1)
+
+    def write(self, name, data):
+        client = self.get_client()
+        from boto3.s3.transfer import TransferConfig
+
+        # Objects larger than a part are uploaded in parts concurrently
+        config = TransferConfig(multipart_threshold=self.part_size, multipart_chunksize=self.part_size, max_concurrency=self.concurrency)
+        client.upload_fileobj(io.BytesIO(data), self.bucket, self.key(name), Config=config)
+
+    def version(self, name):
+        response = self.get_client().head_object(Bucket=self.bucket, Key=self.key(name))
+        return (response.get("ContentLength"), response.get("ETag"))
@@ -0,0 +1,72 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+import io
+import json
+import os
+import tarfile
+import time
+
+class ShardWriter:
+    """Class that writes image slices into size-bounded tar shards, each with a sidecar index."""
+
+    def __init__(self, save_path, prefix, max_size):
+        self.save_path = save_path
+        """The path of the directory to save the shards to."""
+
+        self.prefix = prefix
+        """The prefix of the shard names, unique to the writer."""
+
+        self.max_size = max_size
+        """The maximum size (in bytes) of a shard, unless it has a single slice."""
+
+        self.count = 0
+        self.name = None
+        self.tar = None
+        self.index = None
+
+    def write(self, key, extension, data, metadata):
+        """Write an image slice with its metadata to the current shard, returning its path relative to the save directory."""
+        if self.tar is not None and self.tar.offset > 0 and self.tar.offset + len(data) > self.max_size:
+            self.close()
+
+        if self.tar is None:
+            self.name = "{}-{:06d}.tar".format(self.prefix, self.count)
+            self.tar = tarfile.open(os.path.join(self.save_path, self.name), "w")
+            self.index = open(os.path.join(self.save_path, self.name[:-4] + ".jsonl"), "w")
+            self.count += 1
+
+        # Samples follow the WebDataset convention of members sharing a key, with the metadata also in the tar
+        offset = self.tar.offset
+        self.add(key + "." + extension, data)
+        self.add(key + ".json", json.dumps(metadata).encode())
+        self.index.write(json.dumps(dict(metadata, member=key + "." + extension, offset=offset, size=len(data))) + "\n")
+        return os.path.join(self.name, key + "." + extension)
+
+    def add(self, name, data):
+        """Add a member to the current shard."""
+        info = tarfile.TarInfo(name)
+        info.size = len(data)
+        info.mtime = int(time.time())
+        self.tar.addfile(info, io.BytesIO(data))
+
+    def close(self):
+        """Close the current shard, if any."""
+        if self.tar is not None:
+            self.tar.close()
+            self.index.close()
+            self.tar = None
+            self.index = None
@@ -14,6 +14,9 @@
 # You should have received a copy of the GNU General Public License
 # along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
 
+import mmap
+import os
+
 class SingleFileAnnotationParser:
     """Base class that abstracts the annotation parsing in a single file."""
 
@@ -23,6 +26,12 @@ class SingleFileAnnotationParser:
     labels = None
     """The glob pattern of the file with labels information."""
 
+    ranged = False
+    """Whether byte ranges of the file can be split into annotation items independently."""
+
+    header = False
+    """Whether the first line of the file is a header."""
+
     @classmethod
     def parse_labels(cls, file):
         """Parse a labels file into a list of labels."""
@@ -33,6 +42,78 @@ class SingleFileAnnotationParser:
         """Split a specific annotation file into annotation items."""
         yield None
 
+    @classmethod
+    def split_ranges(cls, file, count):
+        """Split a specific annotation file into byte ranges that start at annotation item boundaries."""
+        if os.path.getsize(file) == 0:
+            return []
+
+        # The file is only scanned around the offsets, and never read whole
+        with open(file, "rb") as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as data:
+            size = len(data)
+            header = None
+            offsets = [0]
+
+            if cls.header:
+                offsets[0] = data.find(b"\n") + 1 or size
+                header = data[:offsets[0]]
+
+            for i in range(1, count):
+                offset = cls.find_item_start(data, header, max(offsets[-1], size * i // count))
+
+                if offset >= size:
+                    break
+                elif offset > offsets[-1]:
+                    offsets.append(offset)
+
+            offsets.append(size)
+            return [(start, end) for start, end in zip(offsets[:-1], offsets[1:]) if end > start]
+
+    @classmethod
+    def find_item_start(cls, data, header, offset):
+        """Find the offset of the first annotation item starting at or after a specific offset."""
+        # Move to the start of the next line
+        if offset > 0 and data[offset - 1] != ord("\n"):
+            offset = data.find(b"\n", offset) + 1 or len(data)
+
+        previous = data.rfind(b"\n", 0, max(offset - 1, 0)) + 1
+
+        while offset < len(data):
+            end = data.find(b"\n", offset) + 1 or len(data)
+
+            if cls.is_item_start(header, data[previous:offset], data[offset:end]):
+                return offset
+
+            previous = offset
+            offset = end
+
+        return len(data)
+
+    @classmethod
+    def is_item_start(cls, header, previous, line):
+        """Check whether a line of a specific annotation file starts an annotation item, given the previous line."""
+        return False
+
+    @classmethod
+    def read_range(cls, file, start, end):
+        """Read the lines of a specific byte range of an annotation file."""
+        with open(file, "rb") as fp:
+            fp.seek(start)
+
+            while start < end:
+                line = fp.readline()
+
+                if line == b"":
+                    break
+
+                start += len(line)
+                yield line.decode()
+
+    @classmethod
+    def split_range(cls, file, labels, start, end):
+        """Split a specific byte range of an annotation file into annotation items."""
+        yield None
+
     @classmethod
     def parse_item(cls, item):
         """Parse a specific annotation item to a usable dict format."""
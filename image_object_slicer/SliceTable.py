@@ -0,0 +1,156 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+from array import array
+
+class SliceTable:
+    """Class that stores the slices of many images in compact columns, instead of a dict per slice."""
+
+    coordinates = ("xmin", "ymin", "xmax", "ymax")
+    """The keys of the coordinates of a slice, in column order."""
+
+    def __init__(self):
+        self.names = []
+        """The name of each image."""
+
+        self.offsets = array("Q", [0])
+        """The offset of the first slice of each image, followed by the total number of slices."""
+
+        self.columns = tuple(array("d") for _ in self.coordinates)
+        """The coordinate columns of the slices."""
+
+        self.relative = array("B")
+        """The bit flags of the coordinates of each slice that are relative to the image size."""
+
+        self.label_ids = array("I")
+        """The label id of each slice."""
+
+        self.labels = []
+        """The label of each label id."""
+
+        self.label_index = {}
+        """The label id of each label."""
+
+    def __len__(self):
+        return len(self.names)
+
+    def append(self, parse):
+        """Append the slices of an image from a parse in the usable dict format."""
+        for slice in parse.get("slices"):
+            relative = 0
+
+            for i, key in enumerate(self.coordinates):
+                # Floating values for the coordinates are relative to the image size
+                if type(slice.get(key)) is float:
+                    relative |= 1 << i
+
+                self.columns[i].append(slice.get(key))
+
+            self.relative.append(relative)
+            self.label_ids.append(self.label_id(slice.get("label")))
+
+        self.names.append(parse.get("name"))
+        self.offsets.append(len(self.relative))
+
+    def extend(self, table, rows=None):
+        """Append some images of another table, which may have different label ids."""
+        label_ids = [self.label_id(label) for label in table.labels]
+
+        for i in range(len(table)) if rows is None else rows:
+            start = table.offsets[i]
+            end = table.offsets[i + 1]
+
+            for column, table_column in zip(self.columns, table.columns):
+                column.extend(table_column[start:end])
+
+            self.relative.extend(table.relative[start:end])
+            self.label_ids.extend(label_ids[label_id] for label_id in table.label_ids[start:end])
+            self.names.append(table.names[i])
+            self.offsets.append(len(self.relative))
+
+    def label_id(self, label):
+        """Get the id of a label, adding it if it is new."""
+        label_id = self.label_index.get(label)
+
+        if label_id is None:
+            label_id = len(self.labels)
+            self.labels.append(label)
+            self.label_index[label] = label_id
+
+        return label_id
+
+    def select(self, rows):
+        """Create a table with only some of the images, keeping all labels."""
+        table = SliceTable()
+        table.labels = self.labels
+        table.label_index = self.label_index
+
+        for i in rows:
+            start = self.offsets[i]
+            end = self.offsets[i + 1]
+
+            for column, table_column in zip(self.columns, table.columns):
+                table_column.extend(column[start:end])
+
+            table.relative.extend(self.relative[start:end])
+            table.label_ids.extend(self.label_ids[start:end])
+            table.names.append(self.names[i])
+            table.offsets.append(len(table.relative))
+
+        return table
+
+    def group(self, i):
+        """Get the slices of an image as a compact tuple of columns, which is cheap to send to the workers."""
+        start = self.offsets[i]
+        end = self.offsets[i + 1]
+        return tuple(column[start:end] for column in self.columns) + (self.relative[start:end], tuple(self.labels[label_id] for label_id in self.label_ids[start:end]))
+
+    def slices(self, i):
+        """Get the slices of an image in the usable dict format."""
+        return self.group_slices(self.group(i))
+
+    def to_dict(self):
+        """Convert the table to the dict format of names, slice groups and labels."""
+        return {"names": list(self.names), "slice_groups": [self.slices(i) for i in range(len(self))], "labels": set(self.labels)}
+
+    @classmethod
+    def slices_group(cls, slices):
+        """Convert slices in the usable dict format to a compact tuple of columns."""
+        table = cls()
+        table.append({"name": None, "slices": slices})
+        return table.group(0)
+
+    @classmethod
+    def group_slices(cls, group):
+        """Convert a compact tuple of columns to slices in the usable dict format."""
+        slices = []
+
+        for values in zip(*group):
+            slice = {key: value if values[4] & (1 << i) else int(value) for i, (key, value) in enumerate(zip(cls.coordinates, values))}
+            slice["label"] = values[5]
+            slices.append(slice)
+
+        return slices
+
+    @classmethod
+    def bndboxes(cls, group, width, height, padding):
+        """Compute the padded bounding boxes of a compact tuple of columns, clamped to the image size."""
+        return [(
+            max(0, (round(xmin * width) if relative & 1 else int(xmin)) - padding),
+            max(0, (round(ymin * height) if relative & 2 else int(ymin)) - padding),
+            min((round(xmax * width) if relative & 4 else int(xmax)) + padding, width),
+            min((round(ymax * height) if relative & 8 else int(ymax)) + padding, height)
+        ) for xmin, ymin, xmax, ymax, relative in zip(*group[:5])]
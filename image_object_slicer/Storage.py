@@ -0,0 +1,49 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+class Storage:
+    """Base class that abstracts the reading and writing of the files under a root path."""
+
+    directories = True
+    """Whether the directories must be created before writing files in them."""
+
+    def __init__(self, root):
+        self.root = root
+        """The path or URL of the root the file names are relative to."""
+
+    def scan(self):
+        """List the names of the files directly under the root."""
+        return []
+
+    def list(self):
+        """List the names of all files under the root, with forward slashes between directories."""
+        return []
+
+    def read(self, name):
+        """Read a file whole."""
+        return b""
+
+    def read_head(self, name, size):
+        """Read the first bytes of a file, such as the header of an image."""
+        return b""
+
+    def write(self, name, data):
+        """Write a file whole, replacing it if it exists."""
+        pass
+
+    def version(self, name):
+        """Get the values that change whenever a file changes, such as its size."""
+        return ()
@@ -0,0 +1,97 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+from queue import Queue
+from threading import Lock, Thread
+
+class ThreadPipeline:
+    """Class that runs items through stages of threads connected by bounded queues."""
+
+    done = object()
+    """The marker put in a queue after its last item."""
+
+    def __init__(self, stages, depth):
+        self.stages = stages
+        """The function and the number of threads of each stage."""
+
+        self.depth = depth
+        """The maximum number of items waiting between two stages."""
+
+    def imap_unordered(self, items):
+        """Run each item through all the stages, yielding the results as they are ready."""
+        queues = [Queue(self.depth) for _ in range(len(self.stages) + 1)]
+        errors = []
+        threads = [Thread(target=self.feed, args=(items, queues[0], errors), daemon=True)]
+
+        for i, (function, count) in enumerate(self.stages):
+            # The last thread to finish a stage marks the end of the next queue
+            remaining = [count, Lock()]
+            next_count = self.stages[i + 1][1] if i + 1 < len(self.stages) else 1
+
+            for _ in range(count):
+                threads.append(Thread(target=self.work, args=(function, queues[i], queues[i + 1], remaining, next_count, errors), daemon=True))
+
+        for thread in threads:
+            thread.start()
+
+        while True:
+            item = queues[-1].get()
+
+            if item is self.done:
+                break
+
+            yield item
+
+        for thread in threads:
+            thread.join()
+
+        if len(errors) > 0:
+            raise errors[0]
+
+    def feed(self, items, queue, errors):
+        """Put the items in the first queue."""
+        try:
+            for item in items:
+                if len(errors) > 0:
+                    break
+
+                queue.put(item)
+        except Exception as e:
+            errors.append(e)
+
+        for _ in range(self.stages[0][1]):
+            queue.put(self.done)
+
+    def work(self, function, in_queue, out_queue, remaining, next_count, errors):
+        """Run a stage function on the items of a queue, putting the results in the next one."""
+        while True:
+            item = in_queue.get()
+
+            if item is self.done:
+                break
+
+            try:
+                if len(errors) == 0:
+                    out_queue.put(function(item))
+            except Exception as e:
+                errors.append(e)
+
+        with remaining[1]:
+            remaining[0] -= 1
+
+            if remaining[0] == 0:
+                for _ in range(next_count):
+                    out_queue.put(self.done)
@@ -20,41 +20,67 @@ class WIDERFaceParser(SingleFileAnnotationParser):
     """Class that abstracts the annotation parsing of the WIDER Face format."""
 
     glob = "wider_face_split/wider_face_*_bbx_gt.txt"
+    ranged = True
 
     @classmethod
     def split_file(cls, file, labels):
         """Split a WIDER Face annotation file into annotation items."""
         with open(file) as fp:
-            item = None
-            i = 0
+            yield from cls.split_lines(fp)
 
-            for line in fp:
-                if i == -1:
-                    try:
-                        i = int(line)
+    @classmethod
+    def is_item_start(cls, header, previous, line):
+        """Check whether a line of a WIDER Face annotation file starts an annotation item, given the previous line."""
+        fields = line.split()
 
-                        if i < 1:
-                            i = -1
-                            raise Exception()
+        if len(fields) == 0:
+            return False
 
-                        item.append(line)
-                    except:
-                        item = [line]
-                elif i == 0:
-                    if item is not None:
-                        yield item
+        # Only the image path lines are not numeric
+        try:
+            float(fields[0])
+            return False
+        except ValueError:
+            return True
+
+    @classmethod
+    def split_range(cls, file, labels, start, end):
+        """Split a byte range of a WIDER Face annotation file into annotation items."""
+        yield from cls.split_lines(cls.read_range(file, start, end))
+
+    @classmethod
+    def split_lines(cls, lines):
+        """Split the lines of a WIDER Face annotation file into annotation items."""
+        item = None
+        i = 0
+
+        for line in lines:
+            if i == -1:
+                try:
+                    i = int(line)
+
+                    if i < 1:
+                        i = -1
+                        raise Exception()
 
-                    item = [line]
-                    i -= 1
-                else:
                     item.append(line)
-                    i -= 1
+                except:
+                    item = [line]
+            elif i == 0:
+                if item is not None:
+                    yield item
+
+                item = [line]
+                i -= 1
+            else:
+                item.append(line)
+                i -= 1
 
-            if item is not None and len(item) > 2:
-                if i > 0:
-                    raise Exception("Item shorter than expected: expected {}, got {}".format(len(item) + i, len(item)))
+        if item is not None and len(item) > 2:
+            if i > 0:
+                raise Exception("Item shorter than expected: expected {}, got {}".format(len(item) + i, len(item)))
 
-                yield item
+            yield item
 
     @classmethod
     def parse_item(cls, item):
@@ -16,78 +16,377 @@
 # along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
 
 import argparse
+import atexit
+from collections import deque
+from queue import Queue
+import contextlib
+import cProfile
+from fnmatch import fnmatchcase
+import hashlib
+import io
+import itertools
+import json
+import math
 import os
-from tqdm import tqdm
-from PIL import Image
-from multiprocessing import Pool, cpu_count
+import sys
 import pathlib
+import shutil
+import signal
+import subprocess
+import tempfile
+import threading
+import time
 
+from .AnnotationCache import AnnotationCache
+from .CropStore import CropStore
+from .FileWatcher import FileWatcher
+from .GlobWalker import GlobWalker
+from .ImageIndex import ImageIndex
+from .LocalStorage import LocalStorage
+from .Manifest import Manifest
+from .Metrics import Metrics
+from .ParserRegistry import ParserRegistry
+from .S3Storage import S3Storage
+from .ShardWriter import ShardWriter
 from .SingleFileAnnotationParser import SingleFileAnnotationParser
-from .PascalVOCParser import PascalVOCParser
-from .COCOParser import COCOParser
-from .CVATImagesParser import CVATImagesParser
-from .DatumaroParser import DatumaroParser
-from .KITTIParser import KITTIParser
-from .LabelMeParser import LabelMeParser
-from .OpenImagesParser import OpenImagesParser
-from .WIDERFaceParser import WIDERFaceParser
-from .YOLOParser import YOLOParser
+from .SliceTable import SliceTable
+from .ThreadPipeline import ThreadPipeline
+
+# Pillow, tqdm and multiprocessing are only imported by the functions that use them, so starting up is fast
 
 __version__ = "1.12.3"
 
-formats = {
+formats = ParserRegistry({
     # The first is always the default
-    "pascalvoc": PascalVOCParser,
-    "coco": COCOParser,
-    "cvatimages": CVATImagesParser,
-    "datumaro": DatumaroParser,
-    "kitti": KITTIParser,
-    "labelme": LabelMeParser,
-    "openimages": OpenImagesParser,
-    "widerface": WIDERFaceParser,
-    "yolo": YOLOParser
-}
+    "pascalvoc": "PascalVOCParser",
+    "coco": "COCOParser",
+    "cvatimages": "CVATImagesParser",
+    "datumaro": "DatumaroParser",
+    "kitti": "KITTIParser",
+    "labelme": "LabelMeParser",
+    "openimages": "OpenImagesParser",
+    "widerface": "WIDERFaceParser",
+    "yolo": "YOLOParser"
+})
+
+label_dirs = set()
+"""The label directories already known to exist in the current process."""
+
+image_index = None
+"""The index of the input images shared with the current process."""
+
+worker_options = {}
+"""The slicing options shared with the current process."""
+
+metrics = None
+"""The metrics of the current run, if they are recorded."""
+
+sliced_labels = set()
+"""The labels of the image slices recorded in the current process."""
+
+shard_writer = threading.local()
+"""The shard writer of the current thread."""
+
+shard_writers = []
+"""The shard writers of the current process."""
+
+storages = {}
+"""The storage of each path or URL used in the current process."""
+
+pixel_limit = None
+"""The decompression bomb limit of Pillow in the current process, checked only for the images decoded whole once it is disabled for large images."""
+
+pixel_sizes = {"L": 1, "P": 1, "I;16": 2, "RGB": 3, "RGBA": 4, "RGBX": 4, "CMYK": 4, "I": 4, "F": 4}
+"""The size (in bytes) of a pixel of the image modes that can be split into strips of rows."""
 
 def main():
+    global metrics
     parser = argparse.ArgumentParser(description="Slice objects from images using annotation files")
     parser.add_argument("-v", "--version", action="version", version="%(prog)s " + __version__)
     parser.add_argument("annotations", help="A path to the directory with the annotation files")
     parser.add_argument("images", help="A path to the directory with the input images")
     parser.add_argument("save", help="A path to the directory to save the image slices to")
-    format_choices = list(formats.keys())
-    parser.add_argument("-f", "--format", choices=format_choices, default=format_choices[0], help="The format of the annotation files (default is {})".format(format_choices[0]))
+    # The registry is only searched for the formats of other packages when the format is not a built-in one, so the choices are not listed
+    format_default = next(iter(formats))
+    parser.add_argument("-f", "--format", choices=formats, default=format_default, metavar="FORMAT", help="The format of the annotation files, built-in or registered by other packages (default is {})".format(format_default))
     parser.add_argument("-p", "--padding", type=int, default=0, help="The amount of padding (in pixels) to add to each image slice")
-    parser.add_argument("-w", "--workers", type=int, default=cpu_count(), help="The number of parallel workers to run (default is cpu count)")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count() or 1, help="The number of parallel workers to run (default is cpu count)")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("-s", "--stream", action="store_true", help="Slice each image as soon as its annotation is parsed, instead of parsing all annotation files first")
+    group.add_argument("-c", "--cache", help="A path to a file to cache the parsed annotation files in, reusing the ones that did not change")
+    parser.add_argument("-l", "--large-image", type=int, metavar="PIXELS", help="Decode only the tiles or strips that intersect each slice of images with more than this amount of pixels")
+    parser.add_argument("-j", "--lossless-jpeg", action="store_true", help="Crop JPEG images losslessly with jpegtran, expanding each slice to the MCU boundaries")
+    parser.add_argument("-r", "--max-side", type=int, metavar="PIXELS", help="Downscale each image slice so its longest side is at most this amount of pixels, decoding JPEG images at a reduced scale when all of their slices allow it")
+    # Free-threaded builds of Python run threads in parallel
+    executor = "processes" if getattr(sys, "_is_gil_enabled", lambda: True)() else "threads"
+    parser.add_argument("-e", "--executor", choices=["processes", "threads"], default=executor, help="The kind of parallel workers to run (default is {})".format(executor))
+    parser.add_argument("--read-ahead", type=int, metavar="DEPTH", help="The number of images to read at once ahead of the workers by threads of the main process, for storage with high latency (default is none, each worker reads its own images)")
+    parser.add_argument("--memory-budget", type=int, metavar="MIB", help="Slice the largest images first, estimating the cost and memory of each from its header and batching the smallest ones, with only as many at once as fit in this amount of memory (in MiB)")
+    parser.add_argument("-i", "--incremental", action="store_true", help="Skip the images whose annotation and file did not change since the last run, recording the slices of each image in a manifest in the save directory")
+    parser.add_argument("--watch", action="store_true", help="Keep running after slicing all images, slicing again the images of the annotation files that are created or modified and removing the slices of the ones that are deleted, recording them in the manifest like --incremental")
+    parser.add_argument("--watch-interval", type=float, default=1, metavar="SECONDS", help="The interval (in seconds) between checks of the annotation files when watching them, if inotify is not available (default is 1)")
+    parser.add_argument("-o", "--output-format", choices=["files", "shards"], default="files", help="Save each image slice to its own file in a directory per label, or pack them into tar shards written by each worker (default is files)")
+    parser.add_argument("--shard-size", type=int, default=1024, metavar="MIB", help="The maximum size (in MiB) of each tar shard (default is 1024)")
+    parser.add_argument("--shard-index", type=int, default=0, metavar="INDEX", help="The index of the part of the job to run, when it is split between nodes (default is 0)")
+    parser.add_argument("--num-shards", type=int, default=1, metavar="COUNT", help="The number of parts to split the job into by a stable hash of the image names, one per node (default is 1)")
+    parser.add_argument("-d", "--dedup", action="store_true", help="Hardlink the image slices with the same content instead of writing them again, skipping the decoding of images whose slices were all seen before")
+    parser.add_argument("-m", "--metrics", metavar="PATH", help="A path to a JSON file to save the wall and CPU times of each phase, the times of each stage of each worker, the bytes read and written and the peak memory to")
+    parser.add_argument("--profile", metavar="DIR", help="A path to a directory to save the cProfile output of the main process and of some worker processes to")
+    parser.add_argument("--profile-workers", type=int, default=1, metavar="COUNT", help="The number of worker processes of each pool to profile (default is 1)")
     args = parser.parse_args()
-    annotation_files = find_annotation_files(formats.get(args.format), args.annotations)
+    options = {"large_image": args.large_image, "jpegtran": None, "executor": args.executor, "shard_size": None, "shard": None, "metrics": args.metrics is not None, "profile": args.profile, "profile_workers": args.profile_workers, "workers": args.workers, "dedup": args.dedup, "max_side": args.max_side, "read_ahead": args.read_ahead, "memory_budget": None, "watch": args.watch}
+    profiler = None
+    watcher = None
+
+    if args.num_shards < 1 or not 0 <= args.shard_index < args.num_shards:
+        raise Exception("The shard index must be between 0 and the number of shards")
+    elif args.num_shards > 1:
+        options["shard"] = (args.shard_index, args.num_shards)
+
+    if args.output_format == "shards" and args.dedup:
+        raise Exception("Could not deduplicate image slices packed into shards")
+    elif args.output_format == "shards" and args.incremental:
+        raise Exception("Could not slice incrementally into shards, since the stale slices of changed images cannot be removed from them")
+    elif args.output_format == "shards":
+        options["shard_size"] = args.shard_size << 20
+        # Shards from previous runs and other nodes are never overwritten
+        options["shard_prefix"] = "shard-" + time.strftime("%Y%m%d%H%M%S")
+
+        if options.get("shard") is not None:
+            options["shard_prefix"] += "-{}".format(args.shard_index)
+
+    if args.read_ahead is not None and args.read_ahead < 1:
+        raise Exception("The read-ahead depth must be at least 1 image")
+    elif args.read_ahead is not None and args.stream:
+        raise Exception("Could not read images ahead while streaming, since they are only known to the workers")
+
+    if get_storage(args.images).directories is False and (args.large_image is not None or args.lossless_jpeg):
+        raise Exception("Could not crop images of an object store straight from their files")
+    elif get_storage(args.save).directories is False and (args.incremental or args.dedup or args.output_format == "shards"):
+        raise Exception("Could not keep a manifest, deduplicate or pack shards in an object store")
+
+    if args.memory_budget is not None and args.memory_budget < 1:
+        raise Exception("The memory budget must be at least 1 MiB")
+    elif args.memory_budget is not None and args.stream:
+        raise Exception("Could not schedule images while streaming, since they are only known to the workers")
+    elif args.memory_budget is not None:
+        options["memory_budget"] = args.memory_budget << 20
+
+    if args.watch and args.stream:
+        raise Exception("Could not watch annotation files while streaming, since the images of each file are not kept")
+    elif args.watch and args.output_format == "shards":
+        raise Exception("Could not watch annotation files while packing shards, since they are only complete when the workers exit")
+    elif args.watch and (get_storage(args.annotations).directories is False or get_storage(args.save).directories is False):
+        raise Exception("Could not watch annotation files or keep a manifest in an object store")
+    elif args.watch:
+        # Only the images of the changed annotation files are sliced again, by comparing them with the manifest
+        args.incremental = True
+
+    if args.max_side is not None and args.max_side < 1:
+        raise Exception("The maximum side must be at least 1 pixel")
+    elif args.max_side is not None and args.lossless_jpeg:
+        raise Exception("Could not downscale image slices cropped losslessly")
+
+    if args.lossless_jpeg:
+        options["jpegtran"] = shutil.which("jpegtran")
+
+        if options.get("jpegtran") is None:
+            raise Exception("Could not find jpegtran, required to crop JPEG images losslessly")
+
+    if args.metrics is not None:
+        metrics = Metrics()
 
-    if len(annotation_files[0]) > 0:
-        parsed_annotation_files = parse_annotation_files(formats.get(args.format), annotation_files, args.workers)
+    if args.profile is not None:
+        make_dir(args.profile)
+        profiler = cProfile.Profile()
+        profiler.enable()
+
+    if args.watch:
+        format = formats.get(args.format)
+        # The changes made while slicing the existing annotation files are found right after
+        watcher = FileWatcher(args.annotations, [format.glob] + ([format.labels] if format.labels is not None else []), args.watch_interval)
+        sources = {}
+
+    with measure_phase("discovery"):
+        # The cache needs all annotation files at once, otherwise they are parsed as they are found
+        annotation_files = find_annotation_files(formats.get(args.format), args.annotations, args.workers, args.cache is None)
+
+        if options.get("shard") is not None and not issubclass(formats.get(args.format), SingleFileAnnotationParser):
+            # Each annotation file has a single image, so the files are split before being parsed
+            shard_files = (file for file in annotation_files[0] if in_shard(pathlib.Path(file).stem, options.get("shard")))
+            annotation_files = (list(shard_files) if isinstance(annotation_files[0], list) else shard_files, annotation_files[1])
+
+        annotation_files = peek_annotation_files(annotation_files)
+
+    if annotation_files is not None and args.stream:
+        with measure_phase("indexing"):
+            index = index_images(args.images)
+
+        make_save_dir(args.save)
+        manifest = open_manifest(args.save, options) if args.incremental else None
+
+        with measure_phase("streaming"):
+            count = stream_annotation_files(formats.get(args.format), annotation_files, args.images, args.padding, args.save, args.workers, index, options, manifest)
+            close_shards()
+
+        if count == 0:
+            print("Found no slices")
+
+        save_shard_labels(args.save, options)
+
+        if manifest is not None:
+            manifest.close()
+    elif annotation_files is not None:
+        with measure_phase("parsing"):
+            cache = open_cache(args.cache, formats.get(args.format), annotation_files) if args.cache is not None else None
+            parsed_annotation_files = parse_annotation_files(formats.get(args.format), annotation_files, args.workers, options, cache, sources if watcher is not None else None)
+
+            if options.get("shard") is not None and issubclass(formats.get(args.format), SingleFileAnnotationParser):
+                parsed_annotation_files = select_shard(parsed_annotation_files, options.get("shard"))
 
         if len(parsed_annotation_files) > 0:
-            make_dir(args.save)
-            create_label_dirs(parsed_annotation_files.get("labels"), args.save)
-            slice_images(args.images, parsed_annotation_files.get("names"), parsed_annotation_files.get("slice_groups"), args.padding, args.save, args.workers)
+            with measure_phase("indexing"):
+                index = index_images(args.images)
+                slice_table = find_images(index, parsed_annotation_files)
+
+            make_save_dir(args.save)
+
+            if options.get("shard_size") is None:
+                create_label_dirs(slice_table.labels, args.save)
+
+            manifest = open_manifest(args.save, options) if args.incremental else None
+
+            with measure_phase("slicing"):
+                slice_images(args.images, slice_table, args.padding, args.save, args.workers, index, options, manifest)
+                close_shards()
+
+            save_shard_labels(args.save, options)
+
+            if manifest is not None:
+                manifest.close()
         else:
             print("Found no slices")
     else:
         print("Found no annotation file")
 
-def find_annotation_files(format, path):
-    """Find all annotation files from a specific path."""
-    print("Finding annotation files: ", end="")
-    files = list(pathlib.Path(path).glob(format.glob))
+    if watcher is not None:
+        watch_annotation_files(watcher, formats.get(args.format), args.images, args.padding, args.save, args.workers, options, sources)
+
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats(os.path.join(args.profile, "main-{}.prof".format(os.getpid())))
+
+    if metrics is not None:
+        metrics.save(args.metrics)
+
+def iter_slices(annotations, images, format=None, padding=0, workers=0, prefetch=None, arrays=False, executor="processes", large_image=None, max_side=None):
+    """Slice objects from images using annotation files, yielding (label, source, box, slice) tuples instead of saving the slices."""
+    if executor == "threads":
+        # Threads would share the slicing options and the decompression bomb limit of the calling process with any other caller
+        raise Exception("Could not slice images with threads from Python, since they would change the state of the calling process")
 
-    if len(files) > 0:
-        files = [str(file) for file in files]
+    format = formats.get(format or next(iter(formats)))
+    options = {"large_image": large_image, "jpegtran": None, "executor": executor, "shard_size": None, "arrays": arrays, "max_side": max_side}
+    annotation_files = find_annotation_files(format, annotations, max(workers, 1), verbose=False)
 
-    if issubclass(format, SingleFileAnnotationParser) and len(files) > 1:
-        raise Exception("Could not find a unique annotation file: {}".format(files))
+    if len(annotation_files[0]) == 0:
+        return
 
-    print("{0}/{0}".format(len(files)))
+    slice_table = parse_annotation_files(format, annotation_files, workers, options, verbose=False)
+
+    if len(slice_table) == 0:
+        return
+
+    index = index_images(images, verbose=False)
+    slice_table = find_images(index, slice_table)
+    tasks = ((images, name, slice_table.group(i), padding, "") for i, name in enumerate(slice_table.names))
+
+    if workers == 0:
+        for task in tasks:
+            # The state is only shared while the image is sliced, so interleaved generators each keep their own
+            with use_worker_state(index, options):
+                slices = extract_slices(task)
+
+            yield from slices
+    else:
+        with create_pool(workers, index, options) as pool:
+            # Only a bounded number of images are sliced ahead of the consumer, in order
+            pending = deque()
+
+            for task in tasks:
+                pending.append(pool.apply_async(extract_slices, (task,)))
+
+                if len(pending) >= (prefetch or workers * 2):
+                    yield from pending.popleft().get()
+
+            while len(pending) > 0:
+                yield from pending.popleft().get()
+
+def merge():
+    parser = argparse.ArgumentParser(description="Merge the label lists and manifests of the shards of a slicing job split between nodes")
+    parser.add_argument("-v", "--version", action="version", version="%(prog)s " + __version__)
+    parser.add_argument("save", help="A path to the directory the image slices were saved to")
+    args = parser.parse_args()
+    labels = set()
+    counts = set()
+    indexes = set()
+
+    for path in pathlib.Path(args.save).glob(".labels-*-of-*.txt"):
+        index, count = path.name[len(".labels-"):-len(".txt")].split("-of-")
+        indexes.add(int(index))
+        counts.add(int(count))
+
+        with open(path) as fp:
+            labels.update(line.rstrip("\n") for line in fp if line != "\n")
+
+    if len(counts) == 0:
+        raise Exception("Could not find any shard label list")
+    elif len(counts) > 1:
+        raise Exception("Found shards of different splits: {}".format(sorted(counts)))
+
+    count = counts.pop()
+    missing = sorted(set(range(count)).difference(indexes))
+
+    if len(missing) > 0:
+        raise Exception("Could not find the label lists of shards: {}".format(missing))
+
+    print("Merging shards: {0}/{0}".format(count))
+
+    with open(os.path.join(args.save, "labels.txt"), "w") as fp:
+        for label in sorted(labels):
+            fp.write(label + "\n")
+
+    manifests = [Manifest.shard_file_name((index, count)) for index in range(count)]
+
+    if all(os.path.exists(os.path.join(args.save, file_name)) for file_name in manifests):
+        Manifest.merge(args.save, manifests)
+
+def find_annotation_files(format, path, workers=1, stream=False, verbose=True):
+    """Find all annotation files from a specific path, as an iterator that yields them as they are found if streamed."""
+    if get_storage(path).directories is False:
+        path = fetch_annotation_files(format, path, workers, verbose)
+
+    if stream and not issubclass(format, SingleFileAnnotationParser):
+        # The directories are only walked as the files are consumed, so parsing starts right away
+        if verbose:
+            print("Finding annotation files")
+
+        iterator = iter(GlobWalker(path, format.glob, workers))
+        first = next(iterator, None)
+        files = [] if first is None else itertools.chain([first], iterator)
+    else:
+        files = list(GlobWalker(path, format.glob, workers))
+
+        if issubclass(format, SingleFileAnnotationParser) and len(files) > 1:
+            raise Exception("Could not find a unique annotation file: {}".format(files))
+
+        if verbose:
+            print("Finding annotation files: {0}/{0}".format(len(files)))
+
+    if format.labels is not None and (not isinstance(files, list) or len(files) > 0):
+        if verbose:
+            print("Finding labels file")
 
-    if len(files) > 0 and format.labels is not None:
-        print("Finding labels file")
         labels = list(pathlib.Path(path).glob(format.labels))
 
         if len(labels) == 0:
@@ -102,6 +401,238 @@ def find_annotation_files(format, path):
     else:
         return (files, None)
 
+def fetch_annotation_files(format, path, workers=1, verbose=True):
+    """Download the annotation files and the labels file of an object store to a temporary directory, returning its path."""
+    from multiprocessing.pool import ThreadPool
+    storage = get_storage(path)
+    # The directories are matched later, by the same glob as local annotation files
+    patterns = [pattern.split("/")[-1] for pattern in (format.glob, format.labels) if pattern is not None]
+    names = [name for name in storage.list() if any(fnmatchcase(name.split("/")[-1], pattern) for pattern in patterns)]
+    temp_path = tempfile.mkdtemp(prefix="image-object-slicer-")
+    atexit.register(shutil.rmtree, temp_path, True)
+
+    if verbose:
+        print("Downloading annotation files: {}".format(len(names)))
+
+    for directory in set(os.path.dirname(name) for name in names):
+        make_dir(temp_path, directory)
+
+    with ThreadPool(max(workers, 1)) as pool:
+        # Annotation files are small, so they are read with a request each, many at once
+        for name, data in pool.imap_unordered(lambda name: (name, storage.read(name)), names):
+            LocalStorage(temp_path).write(name, data)
+
+    return temp_path
+
+def peek_annotation_files(files):
+    """Check if any annotation file is found, without waiting for all of them if they are streamed."""
+    if isinstance(files[0], list):
+        return files if len(files[0]) > 0 else None
+
+    iterator = iter(files[0])
+    first = next(iterator, None)
+
+    if first is None:
+        return None
+
+    return (itertools.chain([first], iterator), files[1])
+
+def index_images(path, verbose=True):
+    """Index all images from a specific path by name without extension."""
+    index = ImageIndex(get_storage(path))
+
+    if verbose:
+        print("Indexing images: {}".format(len(index.files)))
+
+    return index
+
+def find_images(index, slice_table):
+    """Filter out the images without a unique file candidate, reporting them all at once."""
+    rows = []
+
+    for i, name in enumerate(slice_table.names):
+        if "." not in name:
+            files = index.find(name)
+
+            if len(files) == 0:
+                print("No file candidate found: {}.*".format(name))
+                continue
+            elif len(files) > 1:
+                print("Multiple file candidates found: {}".format(files))
+                continue
+
+        rows.append(i)
+
+    if len(rows) == len(slice_table):
+        return slice_table
+
+    return slice_table.select(rows)
+
+def in_shard(name, shard):
+    """Check if an image or annotation file belongs to a shard of the job, by a stable hash of its name."""
+    if shard is None:
+        return True
+
+    # The built-in hash of strings is randomized in each process, so it would differ between nodes
+    digest = hashlib.sha1(name.encode()).digest()
+    return int.from_bytes(digest[:8], "big") % shard[1] == shard[0]
+
+def select_shard(slice_table, shard):
+    """Filter out the images that do not belong to a shard of the job."""
+    rows = [i for i, name in enumerate(slice_table.names) if in_shard(name, shard)]
+    print("Images in shard: {}".format(len(rows)))
+    return slice_table.select(rows)
+
+def save_shard_labels(save_path, options):
+    """Save the labels of the image slices of a shard of the job, to be merged with the other shards."""
+    shard = options.get("shard")
+
+    if shard is not None:
+        get_storage(save_path).write(".labels-{}-of-{}.txt".format(*shard), "".join(label + "\n" for label in sorted(sliced_labels)).encode())
+
+def measure_phase(name):
+    """Record the wall and CPU times of a phase of the run, if the metrics are recorded."""
+    if metrics is None:
+        return contextlib.nullcontext()
+
+    return metrics.phase(name)
+
+def init_worker(index, options):
+    """Share the index of the input images and the slicing options with the current process."""
+    from multiprocessing import current_process, parent_process
+    from multiprocessing.util import Finalize
+    global image_index, worker_options, pixel_limit
+    image_index = index
+    worker_options = options
+
+    if options.get("large_image") is not None:
+        # Large images are opened without the limit, since only their tiles or strips are decoded, and the others are checked once they are decoded whole
+        from PIL import Image
+        pixel_limit = Image.MAX_IMAGE_PIXELS if Image.MAX_IMAGE_PIXELS is not None else pixel_limit
+        Image.MAX_IMAGE_PIXELS = None
+
+    if options.get("watch") and parent_process() is not None:
+        # The main process stops watching on an interrupt, and then terminates the workers
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    if options.get("shard_size") is not None and parent_process() is not None:
+        # The shards are closed when the worker process exits cleanly
+        Finalize(None, close_shards, exitpriority=10)
+
+    # Only the first workers of each pool are profiled, since the others do the same work
+    if options.get("profile") is not None and parent_process() is not None and (current_process()._identity[-1] - 1) % options.get("workers") < options.get("profile_workers"):
+        profiler = cProfile.Profile()
+        Finalize(None, save_profile, (profiler, os.path.join(options.get("profile"), "worker-{}.prof".format(os.getpid()))), exitpriority=10)
+        profiler.enable()
+
+@contextlib.contextmanager
+def use_worker_state(index, options):
+    """Share the index of the input images and the slicing options with the current process only until the context is left, without the setup of the workers."""
+    global image_index, worker_options
+    state = (image_index, worker_options)
+    image_index = index
+    worker_options = options
+
+    try:
+        yield
+    finally:
+        image_index, worker_options = state
+
+def save_profile(profiler, path):
+    """Save the cProfile output of a worker process when it exits."""
+    profiler.disable()
+    profiler.dump_stats(path)
+
+def open_cache(path, format, files):
+    """Open the cache of parsed annotation files, discarding it if the format or the labels file changed."""
+    key = [__version__, format.__name__, None]
+
+    if files[1] is not None:
+        stat = os.stat(files[1])
+        key[2] = (files[1], stat.st_size, stat.st_mtime_ns)
+
+    return AnnotationCache(path, tuple(key))
+
+def open_manifest(save_path, options):
+    """Open the manifest of the save directory, sharing the fingerprints of its images with the workers."""
+    manifest = Manifest(save_path, Manifest.shard_file_name(options.get("shard")))
+    options["fingerprints"] = manifest.fingerprints()
+    return manifest
+
+def record_slices(results, manifest):
+    """Record the results of slicing images in the manifest, if any, and count their slices."""
+    count = 0
+
+    for result in results:
+        if result is not None:
+            count += result.get("slices")
+            sliced_labels.update(result.get("labels"))
+
+            if metrics is not None and result.get("metrics") is not None:
+                metrics.record(result.get("metrics"))
+
+            if manifest is not None:
+                manifest.record(result)
+
+    return count
+
+def create_pool(workers, index=None, options={}):
+    """Create a pool of parallel workers of the selected executor."""
+    if options.get("executor") == "threads":
+        from multiprocessing.pool import ThreadPool
+        return ThreadPool(workers, init_worker, (index, options))
+    else:
+        from multiprocessing import Pool
+        return Pool(workers, init_worker, (index, options))
+
+def join_pool(pool):
+    """Wait for the workers of a pool to exit cleanly, instead of being terminated when it is left."""
+    pool.close()
+    pool.join()
+
+@contextlib.contextmanager
+def use_pool(workers, options={}, pool=None):
+    """Use a pool of workers that is already running, or create one that is joined when done, or none to work in the current process."""
+    if pool is not None or workers == 0:
+        yield pool
+        return
+
+    with create_pool(workers, options=options) as pool:
+        yield pool
+        join_pool(pool)
+
+def imap_bounded(pool, function, tasks, window):
+    """Map a function over tasks in a pool of workers, in any order, taking only a bounded number of tasks ahead of the results, which thread pools do not."""
+    results = Queue()
+    pending = 0
+
+    for task in tasks:
+        if pending >= window:
+            yield take_result(results)
+            pending -= 1
+
+        pool.apply_async(function, (task,), callback=results.put, error_callback=results.put)
+        pending += 1
+
+    for _ in range(pending):
+        yield take_result(results)
+
+def take_result(results):
+    """Wait for the next result of a pool of workers, raising it if it is an error."""
+    result = results.get()
+
+    if isinstance(result, Exception):
+        raise result
+
+    return result
+
+def map_unordered(pool, function, iterable):
+    """Map a function over tasks in a pool of workers, in any order, or in order in the current process if there is no pool."""
+    if pool is None:
+        return map(function, iterable)
+
+    return pool.imap_unordered(function, iterable)
+
 def parse_annotation_file(args):
     """Parse a specific annotation file to a usable dict format."""
     format = args[0]
@@ -117,6 +648,44 @@ def parse_annotation_file(args):
         # Just error if a single file cannot be read
         print("Error parsing annotation file: " + str(e))
 
+def iter_batches(files, workers):
+    """Split annotation files into batches, so tiny files do not cost a task each while the load is still balanced."""
+    if isinstance(files, list):
+        size = max(1, min(256, len(files) // (workers * 4)))
+        yield from (files[i:i + size] for i in range(0, len(files), size))
+        return
+
+    # The number of files is not known while they are found, so the batches start small and grow
+    iterator = iter(files)
+    count = 0
+
+    while True:
+        batch = list(itertools.islice(iterator, min(256, 1 << (count // workers))))
+
+        if len(batch) == 0:
+            break
+
+        yield batch
+        count += 1
+
+def parse_annotation_batch(args):
+    """Parse a batch of annotation files to a table, with the row of each file, which is cheaper to send back than a dict per slice."""
+    format = args[0]
+    labels = args[2]
+    slice_table = SliceTable()
+    rows = []
+
+    for file in args[1]:
+        parse = parse_annotation_file((format, file, labels))
+
+        if parse is None:
+            rows.append(None)
+        else:
+            rows.append(len(slice_table))
+            slice_table.append(parse)
+
+    return (args[1], slice_table, rows)
+
 def parse_annotation_item(args):
     """Parse a specific annotation item to a usable dict format."""
     format = args[0]
@@ -131,17 +700,290 @@ def parse_annotation_item(args):
         # Just error if a single item cannot be read
         print("Error parsing annotation item: " + str(e))
 
-def parse_annotation_files(format, files, workers):
-    """Parse all annotation files."""
-    names = []
-    slice_groups = []
-    labels = set()
+def split_annotation_file(format, file, workers):
+    """Split an annotation file into byte ranges to be parsed by the workers."""
+    try:
+        # More ranges than workers balance the load between them
+        return format.split_ranges(file, workers * 16)
+    except Exception as e:
+        # Raise because this is the only file
+        print("Error parsing annotation file:")
+        raise e
+
+def parse_annotation_range(args):
+    """Parse a specific byte range of an annotation file to a list of usable dict formats."""
+    format = args[0]
+    parses = []
+
+    try:
+        for item in format.split_range(*args[1:]):
+            parse = parse_annotation_item((format, item))
+
+            if parse is not None:
+                parses.append(parse)
+    except Exception as e:
+        # Just error if a single range cannot be read
+        print("Error parsing annotation file range: " + str(e))
+
+    return parses
+
+def parse_annotation_files(format, files, workers, options={}, cache=None, sources=None, pool=None, verbose=True):
+    """Parse all annotation files in a pool of workers, or in the current process if there are none, recording the names of the images with slices of each file in the sources if any."""
+    from tqdm import tqdm
+    # The slices are stored in compact columns instead of dicts
+    slice_table = SliceTable()
     labels_list = None
 
     if files[1] is not None:
         labels_list = format.parse_labels(files[1])
 
     if issubclass(format, SingleFileAnnotationParser):
+        file_parses = cache.get(files[0][0]) if cache is not None else None
+
+        if file_parses is not None:
+            if verbose:
+                print("Found cached annotation file")
+        elif format.ranged:
+            file_parses = []
+            ranges = split_annotation_file(format, files[0][0], max(workers, 1))
+
+            with use_pool(workers, options, pool) as parse_pool:
+                # Each worker reads its own byte range, so only the parsed items cross process boundaries
+                for range_parses in tqdm(map_unordered(parse_pool, parse_annotation_range, ((format, files[0][0], labels_list, start, end) for start, end in ranges)), desc="Parsing annotation file ranges", total=len(ranges), disable=not verbose):
+                    file_parses.extend(range_parses)
+        else:
+            file_parses = []
+
+            try:
+                split = format.split_file(files[0][0], labels_list)
+            except Exception as e:
+                # Raise because this is the only file
+                print("Error parsing annotation file:")
+                raise e
+
+            with use_pool(workers, options, pool) as parse_pool:
+                for parses in tqdm(map_unordered(parse_pool, parse_annotation_item, ((format, item) for item in split)), desc="Parsing annotation file", disable=not verbose):
+                    if parses is not None:
+                        file_parses.append(parses)
+
+        if cache is not None and files[0][0] in cache.stats:
+            cache.put(files[0][0], file_parses)
+
+        for parses in file_parses:
+            slice_table.append(parses)
+
+        if sources is not None:
+            sources[files[0][0]] = set(slice_table.names)
+    else:
+        uncached_files = files[0]
+
+        if cache is not None:
+            uncached_files = []
+
+            for file in files[0]:
+                file_parses = cache.get(file)
+
+                if file_parses is None:
+                    uncached_files.append(file)
+                elif len(file_parses[0].get("slices")) > 0:
+                    slice_table.append(file_parses[0])
+
+                    if sources is not None:
+                        sources[file] = {file_parses[0].get("name")}
+
+            if len(uncached_files) < len(files[0]) and verbose:
+                print("Found cached annotation files: {}/{}".format(len(files[0]) - len(uncached_files), len(files[0])))
+
+        total = len(uncached_files) if isinstance(uncached_files, list) else None
+
+        with use_pool(workers, options, pool) as parse_pool, tqdm(desc="Parsing annotation files", total=total, disable=not verbose) as progress:
+            for batch, batch_table, rows in map_unordered(parse_pool, parse_annotation_batch, ((format, batch, labels_list) for batch in iter_batches(uncached_files, max(workers, 1)))):
+                if cache is not None:
+                    for file, row in zip(batch, rows):
+                        if row is not None:
+                            cache.put(file, [{"name": batch_table.names[row], "slices": batch_table.slices(row)}])
+
+                slice_table.extend(batch_table, [row for row in rows if row is not None and batch_table.offsets[row + 1] > batch_table.offsets[row]])
+                progress.update(len(batch))
+
+                if sources is not None:
+                    record_sources(sources, batch, batch_table, rows)
+
+    if cache is not None:
+        cache.save()
+
+    return slice_table
+
+def record_sources(sources, files, slice_table, rows):
+    """Record the name of the image with slices of each parsed annotation file, if it has one, keeping the previous one of the files that could not be parsed."""
+    for file, row in zip(files, rows):
+        if row is None:
+            # The slices of a file are kept until it parses again, like those of a single annotation file
+            continue
+        elif slice_table.offsets[row + 1] > slice_table.offsets[row]:
+            sources[file] = {slice_table.names[row]}
+        else:
+            sources.pop(file, None)
+
+def watch_annotation_files(watcher, format, images_path, padding, save_path, workers, options, sources):
+    """Slice the images of the annotation files that are created or modified, removing the slices of the images whose annotations are gone, until interrupted."""
+    manifest = open_manifest(save_path, options)
+    # The images sliced before are kept until their annotations are gone
+    manifest.seen.update(manifest.entries.keys())
+    # The images are compared with the manifest here, so the workers never skip them by fingerprints given to them before
+    options = dict(options, fingerprints={})
+    index = index_images(images_path)
+    init_worker(index, options)
+    pool = create_pool(workers, index, options)
+    print("Watching annotation files")
+
+    try:
+        while True:
+            changed, deleted = watcher.wait()
+
+            try:
+                labels_files = watcher.find(format.labels) if format.labels is not None else [None]
+
+                if len(labels_files) != 1:
+                    print("Error finding a unique labels file: {}".format(labels_files))
+                    continue
+
+                labels_list = format.parse_labels(labels_files[0]) if labels_files[0] is not None else None
+                names = set()
+
+                if issubclass(format, SingleFileAnnotationParser):
+                    files = watcher.find(format.glob)
+
+                    if len(files) != 1:
+                        print("Error finding a unique annotation file: {}".format(files))
+                        continue
+
+                    # The file is parsed again whole in the running workers, and only its images that changed are sliced
+                    file_sources = {}
+                    slice_table = parse_annotation_files(format, (files, labels_files[0]), workers, options, None, file_sources, pool, False)
+                    slice_table = select_shard(slice_table, options.get("shard")) if options.get("shard") is not None else slice_table
+
+                    # The sources are only replaced once the file parsed, so the slices of its images are kept until it does
+                    for file_names in sources.values():
+                        names.update(file_names)
+
+                    sources.clear()
+                    sources.update(file_sources)
+                else:
+                    # All annotation files are parsed again if the labels changed
+                    files = watcher.find(format.glob) if labels_files[0] in changed else [file for file in changed if watcher.matches(file, format.glob)]
+                    files = [file for file in files if in_shard(pathlib.Path(file).stem, options.get("shard"))]
+                    slice_table = SliceTable()
+
+                    for batch, batch_table, rows in pool.imap_unordered(parse_annotation_batch, ((format, batch, labels_list) for batch in iter_batches(files, workers))):
+                        slice_table.extend(batch_table, [row for row in rows if row is not None and batch_table.offsets[row + 1] > batch_table.offsets[row]])
+
+                        for file in batch:
+                            names.update(sources.get(file, set()))
+
+                        record_sources(sources, batch, batch_table, rows)
+
+                    for file in deleted:
+                        names.update(sources.pop(file, set()))
+
+                if any("." not in name and len(index.find(name)) == 0 for name in slice_table.names):
+                    # New images were added since the images were indexed, and the workers are only replaced once they are
+                    index = index_images(images_path)
+                    init_worker(index, options)
+                    stale_pool = pool
+                    pool = create_pool(workers, index, options)
+                    join_pool(stale_pool)
+
+                slice_table = find_images(index, slice_table)
+                live = set()
+
+                for file_names in sources.values():
+                    live.update(file_names)
+
+                for name in names.difference(live):
+                    manifest.remove(name)
+
+                tasks = []
+
+                for i, name in enumerate(slice_table.names):
+                    file = find_image(images_path, name)
+
+                    # The images whose annotation and file did not change are skipped
+                    if file is not None and manifest.entries.get(name, {}).get("fingerprint") != fingerprint_image(images_path, "{}.{}".format(*file), slice_table.group(i), padding):
+                        tasks.append((images_path, name, slice_table.group(i), padding, save_path))
+
+                count = 0
+
+                for result in pool.imap_unordered(slice_image, tasks):
+                    count += record_slices([result], manifest)
+
+                print("Sliced images: {} ({} slices), removed images: {}".format(len(tasks), count, len(names.difference(live))))
+            except Exception as e:
+                # Just error if the annotation files are half-written or malformed, they are parsed again when they change
+                print("Error slicing changed annotation files: " + str(e))
+    except KeyboardInterrupt:
+        print("Stopped watching annotation files")
+    finally:
+        watcher.close()
+        join_pool(pool)
+        manifest.close()
+
+def stream_annotation_file(args):
+    """Parse a specific annotation file and slice its image right away."""
+    parse = parse_annotation_file(args[:3])
+
+    if parse is None or len(parse.get("slices")) == 0:
+        return []
+
+    return [slice_image((args[3], parse.get("name"), SliceTable.slices_group(parse.get("slices")), args[4], args[5]))]
+
+def stream_annotation_batch(args):
+    """Parse a batch of annotation files and slice their images right away."""
+    results = []
+
+    for file in args[1]:
+        results.extend(stream_annotation_file((args[0], file) + args[2:]))
+
+    return (len(args[1]), results)
+
+def stream_annotation_item(args):
+    """Parse a specific annotation item and slice its image right away."""
+    parse = parse_annotation_item(args[:2])
+
+    if parse is None or len(parse.get("slices")) == 0 or not in_shard(parse.get("name"), worker_options.get("shard")):
+        return []
+
+    return [slice_image((args[2], parse.get("name"), SliceTable.slices_group(parse.get("slices")), args[3], args[4]))]
+
+def stream_annotation_range(args):
+    """Parse a specific byte range of an annotation file and slice each image right away."""
+    results = []
+
+    for parse in parse_annotation_range(args[:5]):
+        if len(parse.get("slices")) > 0 and in_shard(parse.get("name"), worker_options.get("shard")):
+            results.append(slice_image((args[5], parse.get("name"), SliceTable.slices_group(parse.get("slices")), args[6], args[7])))
+
+    return results
+
+def stream_annotation_files(format, files, images_path, padding, save_path, workers, index=None, options={}, manifest=None):
+    """Parse all annotation files and slice each image as soon as it is parsed."""
+    from tqdm import tqdm
+    count = 0
+    labels_list = None
+
+    if files[1] is not None:
+        labels_list = format.parse_labels(files[1])
+
+    if issubclass(format, SingleFileAnnotationParser) and format.ranged:
+        ranges = split_annotation_file(format, files[0][0], workers)
+
+        with create_pool(workers, index, options) as pool:
+            # Each worker reads its own byte range, so no annotation item crosses process boundaries
+            for results in tqdm(pool.imap_unordered(stream_annotation_range, ((format, files[0][0], labels_list, start, end, images_path, padding, save_path) for start, end in ranges)), desc="Slicing annotation file ranges", total=len(ranges)):
+                count += record_slices(results, manifest)
+
+            join_pool(pool)
+    elif issubclass(format, SingleFileAnnotationParser):
         try:
             split = format.split_file(files[0][0], labels_list)
         except Exception as e:
@@ -149,84 +991,571 @@ def parse_annotation_files(format, files, workers):
             print("Error parsing annotation file:")
             raise e
 
-        with Pool(workers) as pool:
-            for parses in tqdm(pool.imap_unordered(parse_annotation_item, ((format, item) for item in split)), desc="Parsing annotation file"):
-                if parses is not None:
-                    labels = labels.union(parses.get("labels"))
-                    names.append(parses.get("name"))
-                    slice_groups.append(parses.get("slices"))
+        with create_pool(workers, index, options) as pool:
+            # The items are only split as fast as the workers consume them, and only the slice files come back
+            for results in tqdm(imap_bounded(pool, stream_annotation_item, ((format, item, images_path, padding, save_path) for item in split), workers * 4), desc="Slicing annotation items"):
+                count += record_slices(results, manifest)
+
+            join_pool(pool)
     else:
-        with Pool(workers) as pool:
-            for parses in tqdm(pool.imap_unordered(parse_annotation_file, ((format, file, labels_list) for file in files[0])), desc="Parsing annotation files", total=len(files[0])):
-                if parses is not None and len(parses.get("slices")) > 0:
-                    labels = labels.union(parses.get("labels"))
-                    names.append(parses.get("name"))
-                    slice_groups.append(parses.get("slices"))
+        total = len(files[0]) if isinstance(files[0], list) else None
+
+        with create_pool(workers, index, options) as pool, tqdm(desc="Slicing annotation files", total=total) as progress:
+            # The files are only found as fast as the workers consume them
+            for batch_count, results in imap_bounded(pool, stream_annotation_batch, ((format, batch, labels_list, images_path, padding, save_path) for batch in iter_batches(files[0], workers)), workers * 4):
+                count += record_slices(results, manifest)
+                progress.update(batch_count)
+
+            join_pool(pool)
 
-    return {"names": names, "slice_groups": slice_groups, "labels": labels}
+    return count
 
-def slice_images(images_path, names, slice_groups, padding, save_path, workers):
+def slice_images(images_path, slice_table, padding, save_path, workers, index=None, options={}, manifest=None):
     """Loop through all slice groups and slice each image."""
-    with Pool(workers) as pool:
-        for _ in tqdm(pool.imap_unordered(slice_image, ((images_path, name, slices, padding, save_path) for name, slices in zip(names, slice_groups))), desc="Slicing images", total=len(slice_groups)):
-            pass
+    from tqdm import tqdm
+    tasks = ((images_path, name, slice_table.group(i), padding, save_path) for i, name in enumerate(slice_table.names))
+
+    if options.get("memory_budget") is not None or (options.get("read_ahead") is not None and options.get("executor") != "threads"):
+        dispatch_slices(tasks, len(slice_table), workers, index, options, manifest)
+    elif options.get("executor") == "threads":
+        init_worker(index, options)
+        # Pillow releases the GIL while decoding and encoding, so the stages overlap without any IPC
+        pipeline = ThreadPipeline([(read_image, options.get("read_ahead") or workers), (decode_image, workers), (crop_slices, workers), (save_slices, workers)], workers * 2)
+
+        for result in tqdm(pipeline.imap_unordered(tasks), desc="Slicing images", total=len(slice_table)):
+            record_slices([result], manifest)
+    else:
+        with create_pool(workers, index, options) as pool:
+            for result in tqdm(pool.imap_unordered(slice_image, tasks), desc="Slicing images", total=len(slice_table)):
+                record_slices([result], manifest)
+
+            join_pool(pool)
+
+def dispatch_slices(tasks, total, workers, index=None, options={}, manifest=None):
+    """Slice the images in batches submitted as fast as the workers consume them, within the memory budget if there is one, and reading them ahead if asked."""
+    from multiprocessing.pool import ThreadPool
+    from tqdm import tqdm
+    init_worker(index, options)
+    budget = options.get("memory_budget")
+    read_ahead = options.get("read_ahead")
+    events = Queue()
+    pending = 0
+    memory = 0
+
+    # The images read ahead are read by threads of this process, so the workers only wait on slow storage if they get ahead of them
+    with create_pool(workers, index, options) as pool, ThreadPool(read_ahead) if read_ahead is not None else contextlib.nullcontext() as reader:
+        if budget is not None:
+            # The images read ahead are held until the workers take them, so each is scheduled alone and counted with its own memory
+            batches = schedule_tasks(pool, list(tasks), workers, 1 if read_ahead is not None else 256)
+        else:
+            batches = ((0, (task,)) for task in tasks)
+
+        with tqdm(desc="Slicing images", total=total) as progress:
+            for batch in batches:
+                # Only a bounded number of batches are read ahead or wait for the workers, and only as many as fit in the memory budget, unless one is alone
+                while pending > 0 and (pending >= workers + (read_ahead or workers) or (budget is not None and memory + batch[0] > budget)):
+                    change, done = handle_batch_event(events.get(), pool, events, manifest, progress)
+                    memory += change
+                    pending -= done
+
+                # The memory of a batch is counted from the moment it starts being read, so the images read ahead count against the budget
+                memory += batch[0]
+                pending += 1
+
+                if read_ahead is not None:
+                    reader.apply_async(read_batch, (batch,), callback=lambda read, batch=batch: events.put(("read", batch[0], read)), error_callback=events.put)
+                else:
+                    pool.apply_async(slice_batch, (batch,), callback=lambda result: events.put(("sliced", result)), error_callback=events.put)
+
+            while pending > 0:
+                change, done = handle_batch_event(events.get(), pool, events, manifest, progress)
+                memory += change
+                pending -= done
+
+        if reader is not None:
+            join_pool(reader)
+
+        join_pool(pool)
+
+def schedule_tasks(pool, tasks, workers, size=256):
+    """Estimate the cost and the memory of each slicing task, returning them in batches of at most a number of tasks with their memory, the most costly first."""
+    from tqdm import tqdm
+    chunk_size = max(1, min(256, len(tasks) // (workers * 4)))
+    estimates = list(tqdm(pool.imap(estimate_task, tasks, chunk_size), desc="Estimating images", total=len(tasks)))
+    # The images whose headers could not be read are assumed to be as large as the largest ones
+    known = [estimate for estimate in estimates if estimate is not None]
+    default = (max((estimate[0] for estimate in known), default=0), max((estimate[1] for estimate in known), default=0))
+    estimates = [estimate if estimate is not None else default for estimate in estimates]
+    # The tasks are batched until a batch costs a small fraction of the job, so even the last batches are balanced between the workers
+    target = sum(estimate[0] for estimate in estimates) / (workers * 32)
+    batches = [[]]
+    cost = 0
+
+    for i in sorted(range(len(tasks)), key=lambda i: estimates[i][0], reverse=True):
+        if cost >= target or len(batches[-1]) >= size:
+            batches.append([])
+            cost = 0
+
+        batches[-1].append(i)
+        cost += estimates[i][0]
+
+    # The tasks of a batch are sliced one after the other, so it needs the memory of the largest one
+    return [(max(estimates[i][1] for i in batch), tuple(tasks[i] for i in batch)) for batch in batches if len(batch) > 0]
+
+def estimate_task(args):
+    """Estimate the cost (in pixels) and the peak memory (in bytes) of a slicing task, from the header of its image and its slices."""
+    from PIL import Image
+    name = find_image(args[0], args[1])
+
+    if name is None:
+        return (0, 0)
+
+    storage = get_storage(args[0])
+    file = "{}.{}".format(*name)
+
+    try:
+        try:
+            image = Image.open(io.BytesIO(storage.read_head(file, 1 << 16)))
+        except Exception:
+            # The header is after large metadata blocks in some images
+            image = Image.open(io.BytesIO(storage.read(file)))
+    except Exception:
+        return None
+
+    with image:
+        crops = sum(max(0, bndbox[2] - bndbox[0]) * max(0, bndbox[3] - bndbox[1]) for bndbox in SliceTable.bndboxes(args[2], image.width, image.height, args[3]))
+        pixels = image.width * image.height
+        lossless = worker_options.get("jpegtran") is not None and image.format == "JPEG"
+
+        # Images cropped losslessly are never decoded, and large images only around their slices
+        if lossless or (worker_options.get("large_image") is not None and pixels > worker_options.get("large_image")):
+            pixels = crops
+
+        return (pixels + crops, (pixels + crops) * pixel_sizes.get(image.mode, 4))
+
+def read_batch(batch):
+    """Read the images of a batch of slicing tasks, adding the size of their data to its memory."""
+    tasks = tuple(read_image(task) for task in batch[1])
+    return (batch[0] + sum(len(task.get("data")) for task in tasks if task is not None and task.get("data") is not None), tasks)
+
+def slice_batch(batch):
+    """Slice the images of a batch of slicing tasks, returning the results with the memory of the batch."""
+    # The tasks read ahead are dicts, or None for missing images
+    return (batch[0], [slice_image(task) if isinstance(task, tuple) else slice_read_image(task) for task in batch[1]])
+
+def handle_batch_event(event, pool, events, manifest, progress):
+    """Submit a batch of images that was read ahead to the workers, or record the results of slicing one, returning the change in the memory of the batches and the number of batches done."""
+    if isinstance(event, Exception):
+        raise event
+    elif event[0] == "read":
+        # The data read is held until the batch is sliced
+        pool.apply_async(slice_batch, (event[2],), callback=lambda result: events.put(("sliced", result)), error_callback=events.put)
+        return (event[2][0] - event[1], 0)
+
+    record_slices(event[1][1], manifest)
+    progress.update(len(event[1][1]))
+    return (-event[1][0], 1)
+
+def extract_slices(args):
+    """Crop all slices of an image, returning them instead of saving them."""
+    task = crop_slices(decode_image(read_image(args)))
+
+    if task is None:
+        return []
+
+    slices = []
+
+    for label, label_path, slice_path, bndbox, image_slice in task.get("crops"):
+        if worker_options.get("arrays"):
+            # NumPy is only needed by the callers that ask for arrays
+            import numpy
+            image_slice = numpy.asarray(image_slice)
+
+        slices.append((label, task.get("source"), bndbox, image_slice))
+
+    return slices
 
 def slice_image(args):
     """Slice an image from slices."""
-    images_path = args[0]
-    name = args[1].split(".")
+    return save_slices(crop_slices(decode_image(read_image(args))))
+
+def slice_read_image(task):
+    """Slice an image that was already read."""
+    return save_slices(crop_slices(decode_image(task)))
+
+def find_image(images_path, name):
+    """Find the name and extension of the file of an image."""
+    name = name.split(".")
 
     if len(name) == 1:
         name = name[0]
-        files = list(pathlib.Path(images_path).glob(name + ".*"))
 
-        if len(files) > 0:
-            files = [file.name for file in files]
+        if image_index is not None:
+            files = image_index.find(name)
+        else:
+            files = [file.name for file in pathlib.Path(images_path).glob(name + ".*")]
 
         if len(files) == 0:
             print("No file candidate found: {}.*".format(name))
-            return
+            return None
         elif len(files) == 1:
             name = files[0].split(".")
         else:
             print("Multiple file candidates found: {}".format(files))
-            return
+            return None
 
-    extension = name[-1]
-    name = ".".join(name[:-1])
+    return (".".join(name[:-1]), name[-1])
 
-    slices = args[2]
-    padding = args[3]
-    save_path = args[4]
-    image = Image.open(os.path.join(images_path, "{}.{}".format(name, extension)))
+def read_image(args):
+    """Find the image of a slicing task and read its file."""
+    start = time.perf_counter()
+    images_path = args[0]
+    name = find_image(images_path, args[1])
 
-    for i, slice in enumerate(slices):
-        # Floating values for the coordinates are relative to the image size
+    if name is None:
+        return None
 
-        if type(slice.get("xmin")) is float:
-            slice["xmin"] = round(slice.get("xmin") * image.width)
+    path = os.path.join(images_path, "{}.{}".format(*name))
+    task = {"source": args[1], "path": path, "name": name[0], "extension": name[1], "slices": args[2], "count": len(args[2][5]), "padding": args[3], "save_path": args[4], "data": None, "fingerprint": None, "skipped": False, "metrics": None}
 
-        if type(slice.get("ymin")) is float:
-            slice["ymin"] = round(slice.get("ymin") * image.height)
+    if worker_options.get("metrics"):
+        task["metrics"] = {"stages": [], "bytes_read": 0, "bytes_written": 0}
 
-        if type(slice.get("xmax")) is float:
-            slice["xmax"] = round(slice.get("xmax") * image.width)
+    if worker_options.get("fingerprints") is not None:
+        task["fingerprint"] = fingerprint_image(images_path, "{}.{}".format(*name), args[2], args[3])
+        task["skipped"] = worker_options.get("fingerprints").get(args[1]) == task.get("fingerprint")
 
-        if type(slice.get("ymax")) is float:
-            slice["ymax"] = round(slice.get("ymax") * image.height)
+    # Images that are cropped straight from their files are not read ahead
+    if not task.get("skipped") and not is_cropped_from_file(path, name[1]):
+        task["data"] = get_storage(images_path).read("{}.{}".format(*name))
 
-        # Create the bounding box to slice from
-        bndbox = (max(0, slice.get("xmin") - padding), max(0, slice.get("ymin") - padding), min(slice.get("xmax") + padding, image.width), min(slice.get("ymax") + padding, image.height))
-        image_slice = image.crop(bndbox)
+    if worker_options.get("dedup") and not task.get("skipped"):
+        # Duplicated images are recognized by their content, whatever their names
+        task["image_hash"] = hash_file(path) if task.get("data") is None else hashlib.sha1(task.get("data")).hexdigest()
+
+    if task.get("metrics") is not None and not task.get("skipped"):
+        # Images decoded straight from their files are counted whole, even if only some tiles are read
+        task.get("metrics")["bytes_read"] = len(task.get("data")) if task.get("data") is not None else os.path.getsize(path)
+
+    record_stage(task, "read", start)
+    return task
+
+def is_cropped_from_file(path, extension):
+    """Check if an image is cropped straight from its file, losslessly or only around its slices, so reading it whole would be wasted."""
+    if worker_options.get("jpegtran") is not None and extension.lower() in ("jpg", "jpeg"):
+        return True
+    elif worker_options.get("large_image") is None:
+        return False
+
+    from PIL import Image
+
+    try:
+        # Only the header is read to find the size
+        with Image.open(path) as image:
+            return image.width * image.height > worker_options.get("large_image")
+    except Exception:
+        # The error is reported when the image is decoded
+        return True
+
+def record_stage(task, stage, start):
+    """Record the time of a stage of a slicing task in the current worker, if the metrics are recorded."""
+    if task.get("metrics") is not None:
+        task.get("metrics").get("stages").append((stage, "{}-{}".format(os.getpid(), threading.get_native_id()), time.perf_counter() - start))
+
+def hash_file(path):
+    """Compute the content hash of a file without reading it whole into memory."""
+    digest = hashlib.sha1()
+
+    with open(path, "rb") as fp:
+        for chunk in iter(lambda: fp.read(1 << 20), b""):
+            digest.update(chunk)
+
+    return digest.hexdigest()
+
+def fingerprint_image(images_path, file, slices, padding):
+    """Fingerprint the annotation and the file of an image, to detect changes between runs."""
+    data = json.dumps([[list(column) for column in slices], padding, worker_options.get("jpegtran") is not None, worker_options.get("shard_size") is not None, worker_options.get("max_side"), *get_storage(images_path).version(file)])
+    return hashlib.sha1(data.encode()).hexdigest()
+
+def decode_image(task):
+    """Decode the image of a slicing task."""
+    if task is None or task.get("skipped"):
+        return task
 
+    start = time.perf_counter()
+    from PIL import Image
+    image = Image.open(io.BytesIO(task.get("data")) if task.get("data") is not None else task.get("path"))
+    task["data"] = None
+    tiles = None
+    # The bounding boxes are relative to the full size, even if the image is decoded at a reduced scale
+    task["size"] = image.size
+    bndboxes = SliceTable.bndboxes(task.get("slices"), image.width, image.height, task.get("padding"))
+
+    # JPEG images are cropped in the compressed domain, without being decoded
+    lossless = worker_options.get("jpegtran") is not None and image.format == "JPEG"
+
+    if worker_options.get("dedup"):
+        store = CropStore(task.get("save_path"))
+        keys = [CropStore.key(task.get("image_hash"), bndbox, task.get("extension"), lossless, worker_options.get("max_side")) for bndbox in bndboxes]
+        task.update(keys=keys, stored=[store.has(key) for key in keys])
+
+    # Images whose slices were all stored before are not decoded at all
+    decode = not lossless and not all(task.get("stored", [False]))
+
+    if decode and worker_options.get("large_image") is not None and image.width * image.height > worker_options.get("large_image"):
+        tiles = find_region_tiles(image)
+
+        if tiles is None:
+            print("No tiles or strips found, decoding large image whole: {}".format(task.get("path")))
+
+    if decode and tiles is None and worker_options.get("max_side") is not None and image.format == "JPEG":
+        # JPEG images are decoded at 1/2, 1/4 or 1/8 scale if all of their slices are downscaled at least as much
+        reduction = min((max(bndbox[2] - bndbox[0], bndbox[3] - bndbox[1]) for bndbox in bndboxes), default=0) / worker_options.get("max_side")
+
+        if reduction >= 2:
+            image.draft(image.mode, (math.ceil(image.width / reduction), math.ceil(image.height / reduction)))
+
+    if decode and tiles is None:
+        check_pixels(image)
+        image.load()
+
+    task.update(image=image, tiles=tiles, lossless=lossless, scale=(task.get("size")[0] / image.width, task.get("size")[1] / image.height))
+    record_stage(task, "decode", start)
+    return task
+
+def check_pixels(image):
+    """Check that an image decoded whole is not a decompression bomb, like Pillow does when it opens images, if the check was disabled for large images."""
+    from PIL import Image
+
+    if pixel_limit is not None and image.width * image.height > 2 * pixel_limit:
+        raise Image.DecompressionBombError("Image size ({} pixels) exceeds limit of {} pixels, could be decompression bomb DOS attack.".format(image.width * image.height, 2 * pixel_limit))
+
+def crop_slices(task):
+    """Crop all slices of the image of a slicing task."""
+    if task is None or task.get("skipped"):
+        return task
+
+    start = time.perf_counter()
+    image = task.get("image")
+    labels = task.get("slices")[5]
+    crops = []
+
+    # All bounding boxes are computed at once, converting the relative coordinates
+    for i, bndbox in enumerate(SliceTable.bndboxes(task.get("slices"), *task.get("size"), task.get("padding"))):
+        stored = task.get("stored") is not None and task.get("stored")[i]
+        image_slice = None if task.get("lossless") or stored else crop_image(task.get("path"), image, task.get("tiles"), bndbox, task.get("scale"))
+        label_path = os.path.join(task.get("save_path"), labels[i])
+        slice_path = os.path.join(label_path, "{}-{}-{}.{}".format(task.get("name"), labels[i], i, task.get("extension")))
+        crops.append((labels[i], label_path, slice_path, bndbox, image_slice))
+
+    task["crops"] = crops
+    record_stage(task, "crop", start)
+    return task
+
+def save_slices(task):
+    """Encode and save all slices of the image of a slicing task."""
+    if task is None:
+        return None
+    elif task.get("skipped"):
+        return {"name": task.get("source"), "fingerprint": task.get("fingerprint"), "files": None, "slices": task.get("count"), "labels": set(task.get("slices")[5])}
+
+    files = []
+    store = CropStore(task.get("save_path")) if task.get("keys") is not None else None
+
+    for i, (label, label_path, slice_path, bndbox, image_slice) in enumerate(task.get("crops")):
         try:
-            image_slice.save(os.path.join(save_path, slice.get("label"), "{}-{}-{}.{}".format(name, slice.get("label"), i, extension)))
+            start = time.perf_counter()
+
+            # The duplicates of image slices already stored are linked without being encoded, even within the same image
+            if store is not None and store.has(task.get("keys")[i]):
+                make_label_dir(label_path)
+                store.link(task.get("keys")[i], slice_path)
+                files.append(os.path.relpath(slice_path, task.get("save_path")))
+                record_stage(task, "write", start)
+                continue
+
+            # JPEG images cropped losslessly are encoded by jpegtran
+            if image_slice is None:
+                data = crop_jpeg(task.get("path"), task.get("image"), bndbox)
+            else:
+                data = encode_slice(image_slice, task.get("extension"))
+
+            record_stage(task, "encode", start)
+            start = time.perf_counter()
+            written = len(data)
+
+            if worker_options.get("shard_size") is not None:
+                # The dots in the key would be mistaken for the start of the extension
+                key = "{}-{}".format(task.get("name"), i).replace(".", "_")
+                metadata = {"label": label, "source": "{}.{}".format(task.get("name"), task.get("extension")), "box": list(bndbox)}
+                files.append(get_shard_writer(task.get("save_path")).write(key, task.get("extension"), data, metadata))
+            else:
+                make_label_dir(label_path)
+
+                if store is not None:
+                    written = store.put(task.get("keys")[i], data, task.get("extension"))
+                    store.link(task.get("keys")[i], slice_path)
+                else:
+                    get_storage(task.get("save_path")).write(os.path.relpath(slice_path, task.get("save_path")), data)
+
+                files.append(os.path.relpath(slice_path, task.get("save_path")))
+
+            record_stage(task, "write", start)
+
+            if task.get("metrics") is not None:
+                task.get("metrics")["bytes_written"] += written
         except Exception as  e:
             # Just error if a single image does not save
             print("Error saving image slice: " + str(e))
 
+    return {"name": task.get("source"), "fingerprint": task.get("fingerprint"), "files": files, "slices": task.get("count"), "labels": set(task.get("slices")[5]), "metrics": task.get("metrics")}
+
+def make_label_dir(label_path):
+    """Create a label directory the first time its label is seen in the current process."""
+    if label_path not in label_dirs and get_storage(os.path.dirname(label_path)).directories:
+        make_dir(label_path)
+        label_dirs.add(label_path)
+
+def crop_image(path, image, tiles, bndbox, scale=(1, 1)):
+    """Crop a region of an image, decoding only the tiles or strips that intersect it if they are known, and downscale it to the maximum side if there is one."""
+    size = find_slice_size(bndbox)
+
+    if size is not None and tiles is None:
+        from PIL import Image
+        # The region is mapped to the scale the image was decoded at, then cropped and resized at once, reducing it by whole factors first
+        return image.resize(size, Image.LANCZOS, box=(bndbox[0] / scale[0], bndbox[1] / scale[1], bndbox[2] / scale[0], bndbox[3] / scale[1]), reducing_gap=3.0)
+
+    if tiles is not None:
+        image_slice = crop_region(path, image, tiles, bndbox)
+    else:
+        image_slice = image.crop(bndbox)
+
+    if size is not None:
+        from PIL import Image
+        image_slice = image_slice.resize(size, Image.LANCZOS, reducing_gap=3.0)
+
+    return image_slice
+
+def find_slice_size(bndbox):
+    """Find the size to downscale an image slice to, so its longest side is at most the maximum side, if it is larger."""
+    max_side = worker_options.get("max_side")
+    width = bndbox[2] - bndbox[0]
+    height = bndbox[3] - bndbox[1]
+
+    if max_side is None or max(width, height) <= max_side:
+        return None
+
+    factor = max_side / max(width, height)
+    return (max(1, round(width * factor)), max(1, round(height * factor)))
+
+def encode_slice(image_slice, extension):
+    """Encode an image slice in the format of its extension."""
+    from PIL import Image
+    fp = io.BytesIO()
+    image_slice.save(fp, Image.registered_extensions().get("." + extension.lower()))
+    return fp.getvalue()
+
+def get_shard_writer(save_path):
+    """Get the shard writer of the current thread, creating it the first time."""
+    if getattr(shard_writer, "writer", None) is None:
+        # Each worker writes its own shards, so there is no lock contention
+        shard_writer.writer = ShardWriter(save_path, "{}-{}-{}".format(worker_options.get("shard_prefix"), os.getpid(), threading.get_native_id()), worker_options.get("shard_size"))
+        shard_writers.append(shard_writer.writer)
+
+    return shard_writer.writer
+
+def close_shards():
+    """Close the current shards of all shard writers of the current process."""
+    for writer in shard_writers:
+        writer.close()
+
+def crop_jpeg(path, image, bndbox):
+    """Crop a region of a JPEG image losslessly, expanding it up and left to the MCU boundaries."""
+    mcu_width = 8 * max(layer[1] for layer in image.layer)
+    mcu_height = 8 * max(layer[2] for layer in image.layer)
+    x = bndbox[0] - bndbox[0] % mcu_width
+    y = bndbox[1] - bndbox[1] % mcu_height
+    crop = "{}x{}+{}+{}".format(bndbox[2] - x, bndbox[3] - y, x, y)
+    process = subprocess.run([worker_options.get("jpegtran"), "-copy", "all", "-crop", crop, path], capture_output=True)
+
+    if process.returncode != 0:
+        raise Exception(process.stderr.decode().strip())
+
+    return process.stdout
+
+def find_region_tiles(image):
+    """Find the tiles or strips of an image that can be decoded independently, if any."""
+    if getattr(image, "use_load_libtiff", False) or len(image.tile) == 0:
+        return None
+    elif len(image.tile) > 1:
+        return list(image.tile)
+
+    decoder_name, extents, offset, args = image.tile[0]
+
+    if isinstance(args, str):
+        args = (args, 0, 1)
+
+    if decoder_name == "raw" and tuple(extents) == (0, 0) + image.size and len(args) >= 3 and args[0] == image.mode and args[2] == 1 and image.mode in pixel_sizes:
+        # Uncompressed images are split into strips of about 1 MiB
+        stride = args[1] or image.width * pixel_sizes.get(image.mode)
+        rows = max(1, (1 << 20) // stride)
+        return [make_tile("raw", (0, y, image.width, min(y + rows, image.height)), offset + y * stride, (args[0], stride, 1)) for y in range(0, image.height, rows)]
+
+    return None
+
+def make_tile(*tile):
+    """Create a tile of an image, as a named tuple in the versions of Pillow that require it."""
+    from PIL import ImageFile
+
+    # Older versions of Pillow use plain tuples for tiles
+    if hasattr(ImageFile, "_Tile"):
+        return ImageFile._Tile(*tile)
+
+    return tile
+
+def crop_region(path, image, tiles, bndbox):
+    """Crop a region of an image, decoding only the tiles or strips that intersect it."""
+    from PIL import Image
+    tiles = [tile for tile in tiles if tile[1][0] < bndbox[2] and tile[1][2] > bndbox[0] and tile[1][1] < bndbox[3] and tile[1][3] > bndbox[1]]
+
+    if len(tiles) == 0:
+        # The region is outside of the image, so it is blank like the parts of crops outside of it, without decoding anything
+        return Image.new(image.mode, (bndbox[2] - bndbox[0], bndbox[3] - bndbox[1]))
+
+    x0 = min(tile[1][0] for tile in tiles)
+    y0 = min(tile[1][1] for tile in tiles)
+    x1 = max(tile[1][2] for tile in tiles)
+    y1 = max(tile[1][3] for tile in tiles)
+
+    with Image.open(path) as region:
+        # Pretend the image is just the bounding box of the intersecting tiles, so only they are allocated and decoded
+        region.tile = [make_tile(tile[0], (tile[1][0] - x0, tile[1][1] - y0, tile[1][2] - x0, tile[1][3] - y0), tile[2], tile[3]) for tile in tiles]
+        region._size = (x1 - x0, y1 - y0)
+        return region.crop((bndbox[0] - x0, bndbox[1] - y0, bndbox[2] - x0, bndbox[3] - y0))
+
+def make_save_dir(path):
+    """Create the save directory, unless it is in an object store."""
+    if get_storage(path).directories:
+        make_dir(path)
+
+def get_storage(path):
+    """Get the storage of a local path or of an object store URL, creating it the first time in the current process."""
+    storage = storages.get(path)
+
+    if storage is None:
+        storage = S3Storage(path) if path.startswith(S3Storage.scheme) else LocalStorage(path)
+        storages[path] = storage
+
+    return storage
+
 def create_label_dirs(labels, save_path):
     """Create all label directories."""
+    from tqdm import tqdm
+
+    # Object stores have no directories
+    if not get_storage(save_path).directories:
+        return
+
     for label in tqdm(labels, desc="Creating directories"):
         make_dir(save_path, label)
 
@@ -236,7 +1565,8 @@ def make_dir(path, name=""):
 
     if not os.path.exists(path):
         try:
-            os.makedirs(path)
+            # Other workers may be creating the same directory concurrently
+            os.makedirs(path, exist_ok=True)
         except Exception as e:
             # Raise if directory cannot be made, because image slices will not be saved
             print("Error creating directory:")
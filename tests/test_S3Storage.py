@@ -0,0 +1,258 @@
+# This file is part of image-object-slicer
+# Copyright (C) 2022  Natan Junges <natanajunges@gmail.com>
+#
+# image-object-slicer is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# any later version.
+#
+# image-object-slicer is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with image-object-slicer.  If not, see <https://www.gnu.org/licenses/>.
+
+import contextlib
+import hashlib
+import io
+import pickle
+import sys
+import threading
+import types
+import unittest
+from unittest import mock
+
+import image_object_slicer
+from image_object_slicer.S3Storage import S3Storage
+
+class ClientError(Exception):
+    """Class that stands in for the error raised by the clients of botocore."""
+
+    def __init__(self, error_response, operation_name):
+        super().__init__("An error occurred ({}) when calling the {} operation".format(error_response.get("Error", {}).get("Code"), operation_name))
+        self.response = error_response
+
+class Config:
+    """Class that stands in for the client configuration of botocore and the transfer configuration of boto3."""
+
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+class FakePaginator:
+    """Class that pages the keys of a fake bucket like the list_objects_v2 paginator of boto3."""
+
+    def __init__(self, client):
+        self.client = client
+
+    def paginate(self, Bucket, Prefix, Delimiter=None):
+        keys = sorted(key for bucket, key in self.client.objects if bucket == Bucket and key.startswith(Prefix))
+
+        if Delimiter is not None:
+            # The keys under a delimiter are only listed as common prefixes
+            keys = [key for key in keys if Delimiter not in key[len(Prefix):]]
+
+        for i in range(0, max(len(keys), 1), self.client.page_size):
+            page = {"CommonPrefixes": []}
+
+            if len(keys) > 0:
+                page["Contents"] = [{"Key": key} for key in keys[i:i + self.client.page_size]]
+
+            yield page
+
+class FakeClient:
+    """Class that stands in for the S3 client of boto3, serving the objects of a dict and recording the requests made."""
+
+    page_size = 2
+
+    def __init__(self, objects, config=None):
+        self.objects = objects
+        self.config = config
+        self.ranges = []
+        self.uploads = []
+        self.lock = threading.Lock()
+
+    def get_object(self, Bucket, Key, Range):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+
+        data = self.objects[(Bucket, Key)]
+        start, end = (int(bound) for bound in Range[len("bytes="):].split("-"))
+
+        with self.lock:
+            self.ranges.append((start, end))
+
+        if start >= len(data):
+            raise ClientError({"Error": {"Code": "InvalidRange"}}, "GetObject")
+
+        end = min(end, len(data) - 1)
+        return {"Body": io.BytesIO(data[start:end + 1]), "ContentRange": "bytes {}-{}/{}".format(start, end, len(data))}
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "404"}}, "HeadObject")
+
+        data = self.objects[(Bucket, Key)]
+        return {"ContentLength": len(data), "ETag": "\"{}\"".format(hashlib.md5(data).hexdigest())}
+
+    def upload_fileobj(self, Fileobj, Bucket, Key, Config=None):
+        with self.lock:
+            self.objects[(Bucket, Key)] = Fileobj.read()
+            self.uploads.append((Key, Config))
+
+    def get_paginator(self, operation):
+        return FakePaginator(self)
+
+def fake_modules(objects, clients):
+    """Create the modules of boto3 and botocore that S3Storage imports, with clients serving the objects of a dict."""
+    def client(service, config=None):
+        clients.append(FakeClient(objects, config))
+        return clients[-1]
+
+    boto3 = types.ModuleType("boto3")
+    boto3.session = types.ModuleType("boto3.session")
+    boto3.session.Session = lambda: types.SimpleNamespace(client=client)
+    boto3.s3 = types.ModuleType("boto3.s3")
+    boto3.s3.transfer = types.ModuleType("boto3.s3.transfer")
+    boto3.s3.transfer.TransferConfig = Config
+    botocore = types.ModuleType("botocore")
+    botocore.config = types.ModuleType("botocore.config")
+    botocore.config.Config = Config
+    botocore.exceptions = types.ModuleType("botocore.exceptions")
+    botocore.exceptions.ClientError = ClientError
+    return {"boto3": boto3, "boto3.session": boto3.session, "boto3.s3": boto3.s3, "boto3.s3.transfer": boto3.s3.transfer, "botocore": botocore, "botocore.config": botocore.config, "botocore.exceptions": botocore.exceptions}
+
+class TestS3Storage(unittest.TestCase):
+    def setUp(self):
+        self.objects = {}
+        self.clients = []
+        # The modules are only replaced for each test, so boto3 is neither needed nor used
+        patcher = mock.patch.dict(sys.modules, fake_modules(self.objects, self.clients))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(image_object_slicer.storages.clear)
+
+    def make_storage(self, root):
+        storage = S3Storage(root)
+        storage.part_size = 4
+        return storage
+
+    def test_client_per_process(self):
+        storage = self.make_storage("s3://bucket/images")
+        client = storage.get_client()
+        self.assertIs(storage.get_client(), client)
+        self.assertEqual(client.config.max_pool_connections, S3Storage.connections)
+
+        # A forked process cannot share the connections of its parent
+        storage.pid = -1
+        self.assertIsNot(storage.get_client(), client)
+        self.assertEqual(len(self.clients), 2)
+
+    def test_read_small_object(self):
+        self.objects[("bucket", "images/a.jpg")] = b"abc"
+        storage = self.make_storage("s3://bucket/images")
+        self.assertEqual(storage.read("a.jpg"), b"abc")
+        self.assertEqual(storage.get_client().ranges, [(0, 3)])
+
+    def test_read_parts(self):
+        self.objects[("bucket", "images/a.jpg")] = b"0123456789"
+        storage = self.make_storage("s3://bucket/images")
+        self.assertEqual(storage.read("a.jpg"), b"0123456789")
+        self.assertEqual(sorted(storage.get_client().ranges), [(0, 3), (4, 7), (8, 9)])
+
+    def test_read_parts_exact(self):
+        self.objects[("bucket", "images/a.jpg")] = b"01234567"
+        storage = self.make_storage("s3://bucket/images")
+        self.assertEqual(storage.read("a.jpg"), b"01234567")
+        self.assertEqual(sorted(storage.get_client().ranges), [(0, 3), (4, 7)])
+
+    def test_read_empty_object(self):
+        self.objects[("bucket", "images/a.jpg")] = b""
+        storage = self.make_storage("s3://bucket/images")
+        self.assertEqual(storage.read("a.jpg"), b"")
+
+    def test_read_missing_object(self):
+        storage = self.make_storage("s3://bucket/images")
+
+        with self.assertRaises(ClientError):
+            storage.read("a.jpg")
+
+    def test_read_head(self):
+        self.objects[("bucket", "a.jpg")] = b"0123456789"
+        storage = self.make_storage("s3://bucket")
+        self.assertEqual(storage.read_head("a.jpg", 6), b"012345")
+        self.assertEqual(storage.get_client().ranges, [(0, 5)])
+
+    def test_write(self):
+        storage = self.make_storage("s3://bucket/slices/")
+        storage.write("cat/a-cat-0.jpg", b"0123456789")
+        self.assertEqual(self.objects, {("bucket", "slices/cat/a-cat-0.jpg"): b"0123456789"})
+        key, config = storage.get_client().uploads[0]
+        # Objects larger than a part are uploaded in parts
+        self.assertEqual((config.multipart_threshold, config.multipart_chunksize, config.max_concurrency), (4, 4, S3Storage.concurrency))
+
+    def test_version(self):
+        self.objects[("bucket", "images/a.jpg")] = b"abc"
+        storage = self.make_storage("s3://bucket/images")
+        version = storage.version("a.jpg")
+        self.assertEqual(version[0], 3)
+
+        # The version changes with the content, even if the size does not
+        self.objects[("bucket", "images/a.jpg")] = b"abd"
+        self.assertEqual(storage.version("a.jpg")[0], 3)
+        self.assertNotEqual(storage.version("a.jpg"), version)
+
+    def test_scan_delimited(self):
+        for key in ["images/a.jpg", "images/b.jpg", "images/sub/c.jpg", "images/d.jpg", "imagesx/e.jpg", "other/f.jpg"]:
+            self.objects[("bucket", key)] = b""
+
+        storage = self.make_storage("s3://bucket/images/")
+        self.assertEqual(list(storage.scan()), ["a.jpg", "b.jpg", "d.jpg"])
+        self.assertEqual(list(storage.list()), ["a.jpg", "b.jpg", "d.jpg", "sub/c.jpg"])
+
+    def test_scan_without_prefix(self):
+        for key in ["a.jpg", "sub/b.jpg"]:
+            self.objects[("bucket", key)] = b""
+
+        storage = self.make_storage("s3://bucket")
+        self.assertEqual(list(storage.scan()), ["a.jpg"])
+        self.assertEqual(list(storage.list()), ["a.jpg", "sub/b.jpg"])
+
+    def test_scan_empty(self):
+        storage = self.make_storage("s3://bucket/images")
+        self.assertEqual(list(storage.scan()), [])
+
+    def test_pickle_without_client(self):
+        storage = self.make_storage("s3://bucket/images")
+        storage.get_client()
+        storage = pickle.loads(pickle.dumps(storage))
+        self.assertIsNone(storage.client)
+        self.assertEqual((storage.bucket, storage.prefix), ("bucket", "images"))
+
+    def test_slice_object_store(self):
+        from PIL import Image
+
+        for name, boxes in {"a": [("cat", 2, 2, 20, 30), ("dog", 10, 5, 40, 40)], "b": [("cat", 0, 0, 16, 16)]}.items():
+            # The images and the annotation files are larger than a part, so they are read in parts
+            fp = io.BytesIO()
+            Image.new("RGB", (48, 48), (200, 10, 10)).save(fp, "JPEG")
+            self.objects[("bucket", "dataset/images/{}.jpg".format(name))] = fp.getvalue()
+            objects = "".join("<object><name>{}</name><bndbox><xmin>{}</xmin><ymin>{}</ymin><xmax>{}</xmax><ymax>{}</ymax></bndbox></object>".format(*box) for box in boxes)
+            self.objects[("bucket", "dataset/annotations/Annotations/{}.xml".format(name))] = "<annotation><filename>{}.jpg</filename>{}</annotation>".format(name, objects).encode()
+
+        self.objects[("bucket", "dataset/annotations/Annotations/notes.txt")] = b"not an annotation file"
+        argv = ["image-object-slicer", "s3://bucket/dataset/annotations", "s3://bucket/dataset/images", "s3://bucket/slices", "-f", "pascalvoc", "-w", "2", "-e", "threads"]
+
+        # The workers are threads, so they share the replaced modules
+        with mock.patch.object(sys, "argv", argv), mock.patch.object(S3Storage, "part_size", 64), contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+            image_object_slicer.main()
+
+        slices = {key: data for (bucket, key), data in self.objects.items() if key.startswith("slices/")}
+        self.assertEqual(sorted(slices), ["slices/cat/a-cat-0.jpg", "slices/cat/b-cat-0.jpg", "slices/dog/a-dog-1.jpg"])
+
+        with Image.open(io.BytesIO(slices["slices/dog/a-dog-1.jpg"])) as image_slice:
+            self.assertEqual(image_slice.size, (30, 35))
+
+if __name__ == "__main__":
+    unittest.main()